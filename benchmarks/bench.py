@@ -0,0 +1,191 @@
+"""Benchmarks dumping of synthetic IStream3 channel: reports blocks/s and MB/s of
+   full dumps, range dumps, all streams demux and stream files probing"""
+import os
+import io
+import sys
+import gc
+import json
+import time
+import getopt
+import shutil
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from is3dump.channel import Channel, Index  # noqa: E402
+from is3dump.dump import Dump, Demux  # noqa: E402
+from is3dump.stream import make_stream_files  # noqa: E402
+from is3dump.summary import Summary  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def count_blocks(channel, stream_ids, begin=0, end=0):
+    """Returns number of index blocks of streams in range"""
+    return sum(len(Index(chunk, end, begin).table().where(stream_ids=stream_ids, begin=begin))
+               for chunk in channel.chunks)
+
+
+def range_of(channel, share=0.1):
+    """Returns range of share of channel duration from its middle"""
+    first = Index(channel.chunks[0], 0).bounds()[0]
+    last = Index(channel.chunks[-1], 0).bounds()[1]
+    middle, half = (first + last) // 2, int((last - first) * share / 2)
+    return middle - half, middle + half
+
+
+def scenarios(channel_path, output, jobs):
+    """Yields scenario name, function running it and number of blocks it dumps"""
+    channel = Channel(channel_path)
+    channel_id = os.path.basename(channel_path)
+    clip = range_of(channel)
+
+    def dump(stream_id, dump_range=(), **kwargs):
+        return lambda: Dump.create(os.path.join(output, 'dump.%d' % stream_id), Channel(channel_path, stream_id),
+                                   channel_id=channel_id, stream_id=stream_id, range=dump_range,
+                                   **kwargs).write()
+
+    def demux():
+        channel_all = Channel(channel_path)
+        Demux(channel_all, [Dump.create(os.path.join(output, 'demux.%d' % stream_id), channel_all,
+                                        channel_id=channel_id, stream_id=stream_id)
+                            for stream_id in sorted(channel_all.streams)]).write()
+
+    def probe():
+        current = os.getcwd()
+        os.chdir(output)
+        try:
+            make_stream_files(channel_path)
+        finally:
+            os.chdir(current)
+
+    yield 'full_video', dump(synthetic.VIDEO_ID), count_blocks(channel, (synthetic.VIDEO_ID,))
+    yield 'full_audio', dump(synthetic.AUDIO_ID), count_blocks(channel, (synthetic.AUDIO_ID,))
+    yield 'range_video', dump(synthetic.VIDEO_ID, clip), count_blocks(channel, (synthetic.VIDEO_ID,), *clip)
+    yield 'demux', demux, count_blocks(channel, tuple(channel.streams))
+    if jobs > 1:
+        yield 'full_video_jobs', dump(synthetic.VIDEO_ID, jobs=jobs), \
+            count_blocks(channel, (synthetic.VIDEO_ID,))
+    yield 'video_read_ahead', dump(synthetic.VIDEO_ID, read_ahead=4), \
+        count_blocks(channel, (synthetic.VIDEO_ID,))
+    yield 'probe', probe, 0
+
+
+def measure(function, output, repeat, cold=False):
+    """Returns best time of repeated function runs and bytes it wrote to output directory"""
+    best, written = None, 0
+    for _ in range(repeat):
+        for name in os.listdir(output):
+            os.remove(os.path.join(output, name))
+        if cold:
+            Summary.memory.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            gc.collect()
+            elapsed = time.perf_counter() - start
+        written = sum(os.path.getsize(os.path.join(output, name)) for name in os.listdir(output))
+        best = elapsed if best is None else min(best, elapsed)
+    return best, written
+
+
+def benchmark(channel_path, repeat=3, jobs=1, cold=False):
+    """Runs all scenarios over channel, returns their results"""
+    results = {}
+    output = tempfile.mkdtemp(prefix='is3dump-bench-')
+    Summary.directory = None if cold else os.path.join(output, '.cache')
+    dumps = os.path.join(output, 'dumps')
+    os.makedirs(dumps)
+    try:
+        for name, function, blocks in scenarios(channel_path, dumps, jobs):
+            elapsed, written = measure(function, dumps, repeat, cold)
+            results[name] = {'seconds': round(elapsed, 6),
+                             'blocks': blocks,
+                             'bytes': written,
+                             'blocks_per_second': round(blocks / elapsed, 1),
+                             'mb_per_second': round(written / elapsed / 1e6, 3)}
+    finally:
+        shutil.rmtree(output)
+    return results
+
+
+def compare(results, baseline):
+    """Prints results with speedup against baseline results"""
+    for name, result in results.items():
+        line = '%-16s %10.4f s %12.1f blocks/s %10.3f MB/s' % (name, result['seconds'],
+                                                            result['blocks_per_second'],
+                                                            result['mb_per_second'])
+        if name in baseline and result['seconds']:
+            line += '  x%.2f' % (baseline[name]['seconds'] / result['seconds'])
+        print(line)
+
+
+def show_params():
+    """Shows command line parameters"""
+    print("params:\n\t-c(--channel) path to channel to benchmark (def. generated synthetic channel)\n\t"
+          "-n(--chunks) number of chunks of generated channel (def. 4)\n\t"
+          "-s(--seconds) seconds per chunk of generated channel (def. 60)\n\t"
+          "-r(--repeat) runs per scenario, the best is taken (def. 3)\n\t"
+          "-j(--jobs) also benchmark parallel dump with jobs (def. 1)\n\t"
+          "-k(--cold) run without summary cache\n\t"
+          "-o(--save) save results to json file\n\t"
+          "-b(--baseline) compare with results saved earlier\n\t"
+          "-h(--help) this help")
+    sys.exit()
+
+
+def run(argv):
+    """Runs benchmark by command line parameters"""
+    channel_path, save_path, baseline_path = '', '', ''
+    repeat, jobs, cold, chunks, seconds = 3, 1, False, 4, 60
+    try:
+        opts, remainder = getopt.getopt(argv, "c:n:s:r:j:ko:b:h",
+                                        ["channel=", "chunks=", "seconds=", "repeat=", "jobs=", "cold",
+                                         "save=", "baseline=", "help"])
+        if len(remainder):
+            raise getopt.GetoptError('invalid options: ' + ' '.join(remainder))
+    except getopt.GetoptError as opt_error:
+        print(opt_error)
+        show_params()
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            show_params()
+        elif opt in ('-c', '--channel'):
+            channel_path = arg
+        elif opt in ('-n', '--chunks'):
+            chunks = int(arg)
+        elif opt in ('-s', '--seconds'):
+            seconds = int(arg)
+        elif opt in ('-r', '--repeat'):
+            repeat = int(arg)
+        elif opt in ('-j', '--jobs'):
+            jobs = int(arg)
+        elif opt in ('-k', '--cold'):
+            cold = True
+        elif opt in ('-o', '--save'):
+            save_path = arg
+        elif opt in ('-b', '--baseline'):
+            baseline_path = arg
+    generated = ''
+    if not channel_path:
+        generated = tempfile.mkdtemp(prefix='is3dump-channel-')
+        channel_path = os.path.join(generated, 'synthetic')
+        synthetic.generate(channel_path, chunks=chunks, seconds=seconds)
+    try:
+        results = benchmark(channel_path, repeat, jobs, cold)
+    finally:
+        if generated:
+            shutil.rmtree(generated)
+    baseline = {}
+    if baseline_path:
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+    compare(results, baseline)
+    if save_path:
+        with open(save_path, 'w') as save_file:
+            json.dump({'time': time.time(), 'python': sys.version.split()[0], 'results': results},
+                      save_file, indent=2)
+
+
+if __name__ == '__main__':
+    run(sys.argv[1:])
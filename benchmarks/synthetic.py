@@ -0,0 +1,157 @@
+"""Generates synthetic IStream3 channel: index files of 77-byte records marked with 0xbabe,
+   data files with h264 NAL units and aac frames and stream json metadata"""
+import os
+import sys
+import json
+import base64
+import getopt
+import struct
+
+RECORD = struct.Struct('=BBBQQQQIIQQQQH')
+VIDEO_ID, VIDEO_TYPE = 0, 1
+AUDIO_ID, AUDIO_TYPE = 2, 3
+SPS = b'\x67\x42\xc0\x1e\xda\x02\x80\xbf\xe5\xc0\x44\x00\x00\x03\x00\x04\x00\x00\x03\x00\xc8\x3c\x58\xba\x80'
+PPS = b'\x68\xce\x3c\x80'
+AUDIO_CONFIG = 0x1408  # aac lc, 16000 Hz, mono
+AUDIO_FRAME_DURATION = 1024 * 1000 / 16000
+
+
+class Payloads:
+    """Pseudo random payload pool sliced into frames"""
+    def __init__(self, size=1 << 22):
+        self._pool = os.urandom(size)
+        self._position = 0
+
+    def take(self, head, size):
+        """Returns frame starting with header byte"""
+        size = max(1, min(size, len(self._pool) - 1))
+        if self._position + size > len(self._pool):
+            self._position = 0
+        frame = head + self._pool[self._position:self._position + size - 1]
+        self._position += size
+        return frame
+
+
+def frames(seconds, fps, gop, video_bitrate, audio_bitrate, interleave):
+    """Yields (timestamp offset, duration, stream id, stream type, block type, size) of chunk frames
+       ordered by timestamp. Audio frames are written in groups of interleave count stamped by the last one"""
+    events = []
+    frame_duration = 1000. / fps
+    frame_size = video_bitrate // 8 // fps
+    for number in range(int(seconds * fps)):
+        timestamp = int(number * frame_duration)
+        if number % gop == 0:
+            events.append((timestamp, 0, int(frame_duration), VIDEO_ID, VIDEO_TYPE, 7, len(SPS)))
+            events.append((timestamp, 1, int(frame_duration), VIDEO_ID, VIDEO_TYPE, 8, len(PPS)))
+            events.append((timestamp, 2, int(frame_duration), VIDEO_ID, VIDEO_TYPE, 5, frame_size * 4))
+        else:
+            events.append((timestamp, 2, int(frame_duration), VIDEO_ID, VIDEO_TYPE, 1, frame_size * 3 // 4))
+    audio_size = int(audio_bitrate / 8 * AUDIO_FRAME_DURATION / 1000)
+    count = int(seconds * 1000 / AUDIO_FRAME_DURATION)
+    for number in range(count):
+        group_last = min((number // interleave + 1) * interleave, count) - 1
+        events.append((int(group_last * AUDIO_FRAME_DURATION), 3, int(AUDIO_FRAME_DURATION),
+                       AUDIO_ID, AUDIO_TYPE, 0, audio_size))
+    events.sort()
+    for timestamp, _, duration, stream_id, stream_type, block_type, size in events:
+        yield timestamp, duration, stream_id, stream_type, block_type, size
+
+
+def write_metadata(path):
+    """Writes h264 and aac stream metadata"""
+    sprop = (base64.b64encode(SPS) + b',' + base64.b64encode(PPS)).decode()
+    with open(os.path.join(path, 'stream.%d.%d.json' % (VIDEO_ID, VIDEO_TYPE)), 'w') as stream_file:
+        json.dump({'clock-rate': 90000, 'current-sprop-string': sprop,
+                   'profile-level-id': ''.join('%02X' % c for c in SPS[1:4]),
+                   'sprop-string-list': [sprop],
+                   'stream_traits': {'encoding': 'h264', 'mediaType': 'video'}}, stream_file)
+    with open(os.path.join(path, 'stream.%d.%d.json' % (AUDIO_ID, AUDIO_TYPE)), 'w') as stream_file:
+        json.dump({'channel-config': 1, 'clock-rate': 16000,
+                   'fmtp': '97 streamType=0;profile-level-id=1;config=%04x;mode=AAC-hbr;'
+                           'SizeLength=13;IndexLength=3;IndexDeltaLength=3' % AUDIO_CONFIG,
+                   'freq': 16000, 'sample-frequency-index': 8,
+                   'stream_traits': {'encoding': 'aac', 'mediaType': 'audio'},
+                   'stream_type': AUDIO_TYPE}, stream_file)
+
+
+def generate(path, **kwargs):
+    """Writes synthetic channel into path directory. Returns number of index records"""
+    chunks = kwargs.get('chunks', 4)
+    seconds = kwargs.get('seconds', 60)
+    start = kwargs.get('start', 1600000000000)
+    layout = list(frames(seconds,
+                         kwargs.get('fps', 25),
+                         kwargs.get('gop', 50),
+                         kwargs.get('video_bitrate', 2000000),
+                         kwargs.get('audio_bitrate', 32000),
+                         kwargs.get('interleave', 1)))
+    payloads = Payloads()
+    os.makedirs(path, exist_ok=True)
+    write_metadata(path)
+    index = 0
+    for chunk in range(chunks):
+        chunk_start = start + chunk * seconds * 1000
+        name = os.path.join(path, '%d.data' % chunk_start)
+        offset = 0
+        with open(name, 'wb') as data_file, open(name + '.idx', 'wb') as index_file:
+            for timestamp, duration, stream_id, stream_type, block_type, size in layout:
+                if block_type == 7:
+                    frame = SPS
+                elif block_type == 8:
+                    frame = PPS
+                elif stream_type == VIDEO_TYPE:
+                    frame = payloads.take(b'\x65' if block_type == 5 else b'\x41', size)
+                else:
+                    frame = payloads.take(b'\x21', size)
+                data_file.write(frame)
+                offset += len(frame)
+                index_file.write(RECORD.pack(RECORD.size, block_type, stream_type, stream_id,
+                                             1 if block_type == 5 else 0, duration,
+                                             chunk_start + timestamp, timestamp, timestamp,
+                                             len(frame), offset, index, index, 0xbabe))
+                index += 1
+    return index
+
+
+def show_params():
+    """Shows command line parameters"""
+    print("params:\n\t-p(--path) channel directory to create (req.)\n\t"
+          "-n(--chunks) number of chunks (def. 4)\n\t"
+          "-s(--seconds) seconds per chunk (def. 60)\n\t"
+          "-b(--bitrate) video bitrate, bit/s (def. 2000000)\n\t"
+          "-a(--audio) audio bitrate, bit/s (def. 32000)\n\t"
+          "-f(--fps) video frame rate (def. 25)\n\t"
+          "-g(--gop) frames per GOP (def. 50)\n\t"
+          "-i(--interleave) audio frames grouped together (def. 1)\n\t"
+          "-h(--help) this help")
+    sys.exit()
+
+
+def run(argv):
+    """Generates channel by command line parameters"""
+    names = {'-p': 'path', '-n': 'chunks', '-s': 'seconds', '-b': 'video_bitrate', '-a': 'audio_bitrate',
+             '-f': 'fps', '-g': 'gop', '-i': 'interleave'}
+    params = {}
+    try:
+        opts, remainder = getopt.getopt(argv, "p:n:s:b:a:f:g:i:h",
+                                        ["path=", "chunks=", "seconds=", "bitrate=", "audio=",
+                                         "fps=", "gop=", "interleave=", "help"])
+        if len(remainder):
+            raise getopt.GetoptError('invalid options: ' + ' '.join(remainder))
+    except getopt.GetoptError as opt_error:
+        print(opt_error)
+        show_params()
+    long_names = {'--path': '-p', '--chunks': '-n', '--seconds': '-s', '--bitrate': '-b', '--audio': '-a',
+                  '--fps': '-f', '--gop': '-g', '--interleave': '-i'}
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            show_params()
+        key = names[long_names.get(opt, opt)]
+        params[key] = arg if key == 'path' else int(arg)
+    if 'path' not in params:
+        show_params()
+    print('records:', generate(params.pop('path'), **params))
+
+
+if __name__ == '__main__':
+    run(sys.argv[1:])
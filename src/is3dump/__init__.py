@@ -1,3 +1,4 @@
 """Stream dumping from IStream3 channel"""
+from .dump import iter_frames
 VERSION = (0, 0, 1)
 __version__ = '.'.join([str(x) for x in VERSION])
@@ -20,6 +20,7 @@ class Header:
         self._channels = (config >> 3) & 0xf
         self._version = kwargs.get('version', Version.MPEG4)
         self._protection_absent = kwargs.get('protection_absent', True)
+        self._header = self._template()
 
     @property
     def frequency(self):
@@ -34,23 +35,23 @@ class Header:
         """Returns header channels"""
         return self._channels
 
+    def _template(self):
+        """Returns header bytes with zero frame length"""
+        return bytes([0xff,
+                      0xf0 | (self._version << 3) | (0x00 << 1) | self._protection_absent,
+                      (((self._profile-1) << 6) | (self._freq_idx << 2) | (0x00 << 1) |
+                       (self._channels >> 2)) & 0xff,
+                      ((self._channels << 6) | (0x00 << 2)) & 0xff,
+                      0x00,
+                      0x1f,
+                      0xfc])
+
     def encode(self, frame_len):
-        """Returns header as bytearray ready to be saved to file"""
+        """Returns header as bytearray ready to be saved to file.
+           Only 13-bit frame length is patched into precomputed header template"""
         frame_len += 7
-        result = bytearray()
-        result.extend(0xff.to_bytes(1, byteorder='big'))
-        result.extend((0xf0 |
-                      (self._version << 3) |
-                      (0x00 << 1) |
-                       self._protection_absent).to_bytes(1, byteorder='big'))
-        result.extend((((self._profile-1) << 6) |
-                      (self._freq_idx << 2) |
-                      (0x00 << 1) |
-                      (self._channels >> 2)).to_bytes(1, byteorder='big'))
-        result.extend(((self._channels << 6) |
-                      (0x00 << 2) |
-                      ((frame_len >> 11) & 3)).to_bytes(1, byteorder='big'))
-        result.extend((frame_len >> 3).to_bytes(1, byteorder='big'))
-        result.extend((((frame_len & 7) << 5) | 0x1f).to_bytes(1, byteorder='big'))
-        result.extend(0xfc.to_bytes(1, byteorder='big'))
+        result = bytearray(self._header)
+        result[3] |= (frame_len >> 11) & 3
+        result[4] = (frame_len >> 3) & 0xff
+        result[5] |= (frame_len & 7) << 5
         return result
@@ -0,0 +1,191 @@
+"""Dumps many IStream3 channels concurrently and reports results of every job"""
+import os
+import sys
+import json
+import time
+import getopt
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .catalog import open_channel
+from .dump import Dump, Demux
+from .writer import Throttle
+
+
+class Job:
+    """Batch job: dumps channel stream (or all streams if stream is None) in range to output"""
+    def __init__(self, channel, stream=None, dump_range=(), output=''):
+        self.channel = channel
+        self.stream = stream
+        self.range = tuple(dump_range)
+        self.output = output
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(channel={self.channel}, stream={self.stream})'
+
+    @staticmethod
+    def parse(line):
+        """Creates job from manifest line: json object or comma separated channel,stream,from,to,output"""
+        line = line.strip()
+        if line.startswith('{'):
+            fields = json.loads(line)
+            return Job(fields['channel'], fields.get('stream'), fields.get('range', ()),
+                       fields.get('output', ''))
+        channel, stream, begin, end, output = (line.split(',') + [''] * 5)[:5]
+        return Job(channel.strip(),
+                   int(stream) if stream.strip() else None,
+                   tuple(int(k) if k.strip() else 0 for k in (begin, end))
+                   if begin.strip() or end.strip() else (),
+                   output.strip())
+
+
+class Batch:
+    """Runs dump jobs in worker pool sharing channel metadata and output bandwidth cap"""
+    def __init__(self, jobs, **kwargs):
+        self._jobs = jobs
+        self._workers = kwargs.get('workers', 4)
+        self._output_dir = kwargs.get('output_dir', '.')
+        self._override = kwargs.get('override', False)
+        self._chunk_jobs = kwargs.get('chunk_jobs', 1)
+        bandwidth = kwargs.get('bandwidth', 0)
+        self._throttle = Throttle(bandwidth) if bandwidth else None
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_root(root, dump_range=()):
+        """Returns all streams jobs of every channel directory under root"""
+        jobs = []
+        for path, _, names in os.walk(root):
+            if any(name.endswith('.data.idx') for name in names):
+                jobs.append(Job(path, None, dump_range))
+        return sorted(jobs, key=lambda job: job.channel)
+
+    @staticmethod
+    def from_manifest(path):
+        """Returns jobs listed in manifest file, one per line"""
+        with open(path) as manifest:
+            return [Job.parse(line) for line in manifest if line.strip() and not line.startswith('#')]
+
+    def run(self):
+        """Runs all jobs, returns consolidated report"""
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self._workers) as pool:
+            results = list(pool.map(self._run, self._jobs))
+        failed = sum(1 for result in results if result['status'] != 'ok')
+        return {'jobs': len(results),
+                'succeeded': len(results) - failed,
+                'failed': failed,
+                'seconds': round(time.perf_counter() - started, 6),
+                'bytes': sum(output['bytes'] for result in results for output in result.get('outputs', [])),
+                'results': results}
+
+    def _channel(self, path):
+        """Returns channel shared by jobs of the same channel path"""
+        with self._lock:
+            if path not in self._channels:
+                self._channels[path] = open_channel(path)
+            return self._channels[path]
+
+    def _run(self, job):
+        """Runs job, failure is recorded in job result"""
+        result = {'channel': job.channel, 'stream': job.stream, 'range': list(job.range)}
+        started = time.perf_counter()
+        try:
+            dumpers = self._dump(job)
+            result['outputs'] = [{'stream': dumper.stream_id,
+                                  'path': dumper.filename,
+                                  'bytes': os.path.getsize(dumper.filename),
+                                  'range': list(dumper.range)} for dumper in dumpers]
+            result['status'] = 'ok'
+        except Exception as error:  # a failed job must not stop the batch
+            result['status'] = 'failed'
+            result['error'] = f'{error.__class__.__name__}: {error}'
+        result['seconds'] = round(time.perf_counter() - started, 6)
+        return result
+
+    def _dump(self, job):
+        """Dumps job streams, returns their dumpers"""
+        channel = self._channel(job.channel)
+        channel_id = os.path.basename(job.channel.rstrip('/'))
+        options = {'channel_id': channel_id, 'range': job.range, 'log': None, 'jobs': self._chunk_jobs}
+        if self._throttle is not None:
+            options['throttle'] = self._throttle
+        if job.stream is None:
+            demux = Demux.create(job.output or self._output_dir, channel, override=self._override, **options)
+            demux.write()
+            return demux.dumpers
+        if job.stream not in channel.stream_ids:
+            raise ValueError(f'no stream {job.stream}')
+        output = job.output or os.path.join(self._output_dir, channel_id + '.' + str(job.stream) + '.' +
+                                            channel.search('encoding', job.stream))
+        if not self._override and os.path.exists(output):
+            raise IOError(output)
+        dumper = Dump.create(output, channel, stream_id=job.stream, **options)
+        if dumper is None:
+            raise ValueError(f'unsupported encoding of stream {job.stream}')
+        dumper.write()
+        return [dumper]
+
+
+def show_params():
+    """Shows command line parameters"""
+    print("params:\n\t-R(--root) directory with channel directories, all their streams are dumped\n\t"
+          "-m(--manifest) file of jobs: json objects or channel,stream,from,to,output lines\n\t"
+          "-d(--dump) directory of dumpfiles without output path (def. .)\n\t"
+          "-r(--range) dumping range (from, to) of root channels (def. (begin, end))\n\t"
+          "-n(--workers) number of jobs run concurrently (def. 4)\n\t"
+          "-j(--jobs) number of chunks extracted in parallel by every job (def. 1)\n\t"
+          "-b(--bandwidth) total output bandwidth cap, bytes per second (def. unlimited)\n\t"
+          "-t(--report) save json report to file (def. standard output)\n\t"
+          "-o(--override) override existing files\n\t"
+          "-h(--help) this help")
+    sys.exit()
+
+
+def run():
+    """Runs batch by command line parameters"""
+    root, manifest, report_path, dump_range = '', '', '', ()
+    options = {'output_dir': '.', 'workers': 4, 'chunk_jobs': 1, 'bandwidth': 0, 'override': False}
+    opts = ()
+    try:
+        opts, remainder = getopt.getopt(sys.argv[1:],
+                                        "R:m:d:r:n:j:b:t:oh",
+                                        ["root=", "manifest=", "dump=", "range=", "workers=", "jobs=",
+                                         "bandwidth=", "report=", "override", "help"])
+        if len(remainder):
+            raise getopt.GetoptError('invalid options: ' + ' '.join(remainder))
+    except getopt.GetoptError as opt_error:
+        print(opt_error)
+        show_params()
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            show_params()
+        elif opt in ('-R', '--root'):
+            root = arg
+        elif opt in ('-m', '--manifest'):
+            manifest = arg
+        elif opt in ('-d', '--dump'):
+            options['output_dir'] = arg
+        elif opt in ('-r', '--range'):
+            dump_range = tuple(int(k) if len(k) else 0 for k in arg.split(','))
+        elif opt in ('-n', '--workers'):
+            options['workers'] = int(arg)
+        elif opt in ('-j', '--jobs'):
+            options['chunk_jobs'] = int(arg)
+        elif opt in ('-b', '--bandwidth'):
+            options['bandwidth'] = int(arg)
+        elif opt in ('-t', '--report'):
+            report_path = arg
+        elif opt in ('-o', '--override'):
+            options['override'] = True
+    if not root and not manifest:
+        show_params()
+    jobs = Batch.from_manifest(manifest) if manifest else Batch.from_root(root, dump_range)
+    os.makedirs(options['output_dir'], exist_ok=True)
+    report = Batch(jobs, **options).run()
+    if report_path:
+        with open(report_path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
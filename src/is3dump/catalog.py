@@ -0,0 +1,231 @@
+"""Module describes SQLite catalog of IStream3 channels: streams metadata and chunks time coverage
+   refreshed incrementally by directory, stream metadata and index file modification times.
+   Channels are catalogued explicitly by is3dump-catalog, dumps use catalog for catalogued channels only"""
+import os
+import sys
+import json
+import getopt
+import sqlite3
+from .channel import Channel
+from .summary import Summary
+
+VERSION = 2
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS channels (path TEXT PRIMARY KEY, mtime INTEGER NOT NULL, streams TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS streams (channel TEXT NOT NULL, stream_id INTEGER NOT NULL,
+                                    encoding TEXT NOT NULL, media_type TEXT NOT NULL, fmtp TEXT NOT NULL,
+                                    metadata TEXT NOT NULL, PRIMARY KEY (channel, stream_id));
+CREATE TABLE IF NOT EXISTS chunks (path TEXT PRIMARY KEY, channel TEXT NOT NULL,
+                                   size INTEGER NOT NULL, mtime INTEGER NOT NULL, first INTEGER, last INTEGER);
+CREATE TABLE IF NOT EXISTS chunk_streams (chunk TEXT NOT NULL, stream_id INTEGER NOT NULL,
+                                          blocks INTEGER NOT NULL, bytes INTEGER NOT NULL,
+                                          PRIMARY KEY (chunk, stream_id));
+CREATE INDEX IF NOT EXISTS chunks_channel ON chunks (channel);
+CREATE INDEX IF NOT EXISTS chunks_time ON chunks (last, first);
+'''
+
+
+class Catalog:
+    """Persistent catalog of channels. Channel is rescanned if its directory or stream metadata files
+       have changed, otherwise only its chunks changed since cataloguing are summarized again.
+       Every chunk is committed on its own, so catalog is never locked for the whole scan"""
+    path = os.environ.get('IS3DUMP_CATALOG',
+                          os.path.join(Summary.directory, 'catalog.sqlite') if Summary.directory else '')
+
+    def __init__(self, path=None):
+        self._path = path or Catalog.path
+        if os.path.dirname(self._path):
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        self._connection = sqlite3.connect(self._path, timeout=30)
+        if self._connection.execute('PRAGMA user_version').fetchone()[0] != VERSION:
+            self._connection.executescript('DROP TABLE IF EXISTS channels; DROP TABLE IF EXISTS streams; '
+                                           'DROP TABLE IF EXISTS chunks; DROP TABLE IF EXISTS chunk_streams; '
+                                           'PRAGMA user_version = {};'.format(VERSION))
+        self._connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Closes catalog database"""
+        self._connection.close()
+
+    def refresh(self, root):
+        """Updates every channel directory under root, forgets channels which are gone.
+           Returns number of channels"""
+        root = os.path.abspath(root)
+        found = set()
+        for path, _, names in os.walk(root):
+            if any(name.endswith('.data.idx') for name in names):
+                self.update(path)
+                found.add(path)
+        with self._connection:
+            for (path,) in self._connection.execute('SELECT path FROM channels').fetchall():
+                if path not in found and path.startswith(os.path.join(root, '')):
+                    self._forget(path)
+        return len(found)
+
+    def update(self, path):
+        """Updates channel catalog record: rescans channel if its directory or stream metadata files
+           have changed, updates its chunks changed since cataloguing otherwise"""
+        path = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime_ns
+        row = self._connection.execute('SELECT mtime, streams FROM channels WHERE path = ?', (path,)).fetchone()
+        if row is not None and row[0] == mtime and row[1] == self._streams_stat(path, json.loads(row[1])):
+            for (chunk,) in self._connection.execute('SELECT path FROM chunks WHERE channel = ? ORDER BY path',
+                                                     (path,)).fetchall():
+                with self._connection:
+                    self._update_chunk(path, chunk)
+            return
+        names = [name for name in os.listdir(path) if name.startswith('stream.')]
+        streams = self._streams_stat(path, names)
+        channel = Channel(path)
+        with self._connection:
+            self._connection.execute('DELETE FROM streams WHERE channel = ?', (path,))
+            for stream_id, metadata in channel.streams.items():
+                self._connection.execute('INSERT INTO streams VALUES (?, ?, ?, ?, ?, ?)',
+                                         (path, stream_id,
+                                          str(channel.search('encoding', stream_id)),
+                                          str(channel.search('mediaType', stream_id)),
+                                          str(channel.search('fmtp', stream_id)),
+                                          json.dumps(metadata)))
+            known = {chunk for (chunk,) in self._connection.execute('SELECT path FROM chunks WHERE channel = ?',
+                                                                    (path,))}
+            for chunk in known - set(channel.chunks):
+                self._forget_chunk(chunk)
+        for chunk in channel.chunks:
+            with self._connection:
+                self._update_chunk(path, chunk)
+        with self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO channels VALUES (?, ?, ?)', (path, mtime, streams))
+
+    def contains(self, path):
+        """Checks if channel is catalogued"""
+        return self._connection.execute('SELECT 1 FROM channels WHERE path = ?',
+                                        (os.path.abspath(path),)).fetchone() is not None
+
+    def channel(self, path, stream_id=0):
+        """Returns up to date channel restored from catalog without listing its directory"""
+        self.update(path)
+        key = os.path.abspath(path)
+        chunks = [os.path.join(path, os.path.basename(chunk)) for (chunk,) in
+                  self._connection.execute('SELECT path FROM chunks WHERE channel = ? ORDER BY path', (key,))]
+        streams = {stream_id: json.loads(metadata) for stream_id, metadata in
+                   self._connection.execute('SELECT stream_id, metadata FROM streams WHERE channel = ?', (key,))}
+        return Channel.restore(path, chunks, streams, stream_id)
+
+    def find(self, begin=0, end=0, encoding=''):
+        """Returns channel streams having blocks in range (from begin till end) and of encoding if set
+           with their time coverage"""
+        rows = self._connection.execute(
+            'SELECT c.channel, s.stream_id, s.encoding, MIN(c.first), MAX(c.last), '
+            'SUM(cs.blocks), SUM(cs.bytes) '
+            'FROM chunks c JOIN chunk_streams cs ON cs.chunk = c.path '
+            'JOIN streams s ON s.channel = c.channel AND s.stream_id = cs.stream_id '
+            'WHERE c.last >= ? AND (? = 0 OR c.first <= ?) AND (? = \'\' OR s.encoding = ?) '
+            'GROUP BY c.channel, s.stream_id ORDER BY c.channel, s.stream_id',
+            (begin, end, end, encoding, encoding))
+        return [{'channel': channel, 'stream': stream_id, 'encoding': stream_encoding,
+                 'first': first, 'last': last, 'blocks': blocks, 'bytes': size}
+                for channel, stream_id, stream_encoding, first, last, blocks, size in rows]
+
+    def _update_chunk(self, channel, chunk):
+        """Updates chunk coverage if its index file has changed"""
+        stat = os.stat(chunk)
+        row = self._connection.execute('SELECT size, mtime FROM chunks WHERE path = ?', (chunk,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return
+        summary = Summary.load(chunk)
+        bounds = summary.bounds or (None, None)
+        self._connection.execute('INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?)',
+                                 (chunk, channel, stat.st_size, stat.st_mtime_ns, bounds[0], bounds[1]))
+        self._connection.execute('DELETE FROM chunk_streams WHERE chunk = ?', (chunk,))
+        self._connection.executemany('INSERT INTO chunk_streams VALUES (?, ?, ?, ?)',
+                                     [(chunk, stream_id, stream['blocks'], stream['bytes'])
+                                      for stream_id, stream in summary.streams.items()])
+
+    @staticmethod
+    def _streams_stat(path, names):
+        """Returns json of size and modification time of existing stream metadata files of names"""
+        stats = {}
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+            stats[name] = [stat.st_size, stat.st_mtime_ns]
+        return json.dumps(stats, sort_keys=True)
+
+    def _forget_chunk(self, chunk):
+        self._connection.execute('DELETE FROM chunk_streams WHERE chunk = ?', (chunk,))
+        self._connection.execute('DELETE FROM chunks WHERE path = ?', (chunk,))
+
+    def _forget(self, path):
+        chunks = self._connection.execute('SELECT path FROM chunks WHERE channel = ?', (path,)).fetchall()
+        for (chunk,) in chunks:
+            self._forget_chunk(chunk)
+        self._connection.execute('DELETE FROM streams WHERE channel = ?', (path,))
+        self._connection.execute('DELETE FROM channels WHERE path = ?', (path,))
+
+
+def open_channel(path, stream_id=0):
+    """Returns channel restored from catalog if catalog exists and channel is catalogued in it,
+       read from channel directory otherwise. Catalog is never created or filled as a side effect"""
+    if not Catalog.path or not os.path.exists(Catalog.path):
+        return Channel(path, stream_id)
+    if not os.path.exists(path):
+        raise IOError(path)
+    try:
+        with Catalog() as catalog:
+            if catalog.contains(path):
+                return catalog.channel(path, stream_id)
+    except (sqlite3.Error, OSError):
+        pass
+    return Channel(path, stream_id)
+
+
+def show_params():
+    """Shows command line parameters"""
+    print("params:\n\t-R(--root) refresh catalog with channel directories under root\n\t"
+          "-r(--range) find channel streams with blocks in range (from, to) (def. (begin, end))\n\t"
+          "-e(--encoding) find channel streams of encoding only\n\t"
+          "-C(--catalog) catalog file (def. IS3DUMP_CATALOG or catalog.sqlite in summary cache directory)\n\t"
+          "-h(--help) this help")
+    sys.exit()
+
+
+def run():
+    """Refreshes and queries catalog by command line parameters"""
+    root, encoding, path, dump_range = '', '', '', ()
+    opts = ()
+    try:
+        opts, remainder = getopt.getopt(sys.argv[1:], "R:r:e:C:h",
+                                        ["root=", "range=", "encoding=", "catalog=", "help"])
+        if len(remainder):
+            raise getopt.GetoptError('invalid options: ' + ' '.join(remainder))
+    except getopt.GetoptError as opt_error:
+        print(opt_error)
+        show_params()
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            show_params()
+        elif opt in ('-R', '--root'):
+            root = arg
+        elif opt in ('-r', '--range'):
+            dump_range = tuple(int(k.ljust(13, '0')) if len(k) else 0 for k in arg.split(','))
+        elif opt in ('-e', '--encoding'):
+            encoding = arg
+        elif opt in ('-C', '--catalog'):
+            path = arg
+    if not path and not Catalog.path:
+        show_params()
+    with Catalog(path) as catalog:
+        if root:
+            catalog.refresh(root)
+        json.dump(catalog.find(dump_range[0] if len(dump_range) > 0 else 0,
+                               dump_range[1] if len(dump_range) > 1 else 0,
+                               encoding), sys.stdout, indent=2)
+        sys.stdout.write('\n')
@@ -1,7 +1,85 @@
 """Module describes IStream3 data channel"""
 import os
 import json
+import mmap
 import struct
+import threading
+import contextlib
+from collections import OrderedDict
+from .stats import STATS
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class HandlePool:
+    """Shared pool of read-only file handles keeping no more than limit descriptors open.
+       Handles are borrowed and given back, idle handles are reused for the same path
+       and the least recently used idle handles are closed first"""
+    def __init__(self, limit=64):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._idle = OrderedDict()
+        self._opened = 0
+
+    def __len__(self):
+        return self._opened
+
+    def acquire(self, path):
+        """Returns handle of path not shared with other borrowers"""
+        with self._lock:
+            handles = self._idle.get(path)
+            if handles:
+                handle = handles.pop()
+                if not handles:
+                    del self._idle[path]
+                handle.seek(0, 0)
+                return handle
+            self._evict(self.limit - 1)
+            self._opened += 1
+        try:
+            return open(path, 'rb')
+        except OSError:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def release(self, path, handle):
+        """Gives borrowed handle back to pool"""
+        with self._lock:
+            self._idle.setdefault(path, []).append(handle)
+            self._idle.move_to_end(path)
+            self._evict(self.limit)
+
+    @contextlib.contextmanager
+    def handle(self, path):
+        """Lends handle of path while in context"""
+        handle = self.acquire(path)
+        try:
+            yield handle
+        finally:
+            self.release(path, handle)
+
+    def close(self, prefix=''):
+        """Closes idle handles of paths starting with prefix"""
+        with self._lock:
+            for path in [path for path in self._idle if path.startswith(prefix)]:
+                for handle in self._idle.pop(path):
+                    handle.close()
+                    self._opened -= 1
+
+    def _evict(self, limit):
+        """Closes least recently used idle handles while more than limit are open"""
+        while self._opened > limit and self._idle:
+            path, handles = next(iter(self._idle.items()))
+            handles.pop(0).close()
+            self._opened -= 1
+            if not handles:
+                del self._idle[path]
+
+
+HANDLES = HandlePool(int(os.environ.get('IS3DUMP_MAX_FILES', 64)))
 
 
 class Channel:
@@ -23,27 +101,84 @@ class Channel:
         if os.path.exists(path) is False:
             raise IOError(path)
 
+        self.path = path
         self.chunks = []
         self.metadata = None
+        self._streams = {}
+        self._stream_files = {}
         for name in os.listdir(path):
             if name.endswith('.data.idx'):
                 self.chunks.append(os.path.join(path, name))
-            elif name.startswith('stream.'+str(stream_id)+'.'):
-                with open(os.path.join(path, name)) as stream_file:
-                    self.metadata = json.load(stream_file)
+            elif name.startswith('stream.') and name.split('.')[1].isdigit():
+                self._stream_files[int(name.split('.')[1])] = os.path.join(path, name)
         self.chunks.sort()
+        self.metadata = self._stream(stream_id)
+
+    @classmethod
+    def restore(cls, path, chunks, streams, stream_id=0):
+        """returns channel of known chunks and streams metadata without reading channel directory"""
+        channel = cls.__new__(cls)
+        channel.path = path
+        channel.chunks = list(chunks)
+        channel._streams = dict(streams)
+        channel._stream_files = {}
+        channel.metadata = channel._streams.get(stream_id)
+        return channel
+
+    @property
+    def stream_ids(self):
+        """returns sorted ids of channel streams, their metadata is not read"""
+        return sorted(set(self._stream_files) | set(self._streams))
+
+    @property
+    def streams(self):
+        """returns metadata of every channel stream by id, stream files are read on first use"""
+        for stream_id in self._stream_files:
+            self._stream(stream_id)
+        return self._streams
+
+    def _stream(self, stream_id):
+        """returns metadata of stream read on first use, None if channel has no such stream"""
+        if stream_id not in self._streams and stream_id in self._stream_files:
+            with open(self._stream_files[stream_id]) as stream_file:
+                self._streams[stream_id] = json.load(stream_file)
+        return self._streams.get(stream_id)
 
-    def search(self, key):
-        """search in IStream3 channel json metadata by key"""
-        return Channel.search_in_meta(self.metadata, key)
+    def refresh(self):
+        """re-reads channel chunks list to pick up new chunks"""
+        self.chunks = sorted(os.path.join(self.path, name) for name in os.listdir(self.path)
+                             if name.endswith('.data.idx'))
+
+    def search(self, key, stream_id=None):
+        """search in IStream3 channel json metadata by key (in metadata of stream_id if set)"""
+        return Channel.search_in_meta(self.metadata if stream_id is None else self._stream(stream_id), key)
 
 
 class Block:
     """IStream3 index entry"""
+    SIZE = 77
+    MARK = 0xbabe
+    FIELDS = ('entry_size', 'block_type', 'stream_type', 'stream_id', 'flags', 'duration', 'timestamp',
+              'ts_rel', 'dts_rel', 'block_size', 'offset', 'index', 'block_id', 'mark')
+    STRUCT = struct.Struct('=BBBQQQQIIQQQQH')
+
     def __init__(self, fd) -> None:
-        self._block = fd.read(77)
-        if len(self._block) != 77:
+        self._block = fd.read(Block.SIZE)
+        if len(self._block) != Block.SIZE:
             raise EOFError()
+        self._assign(Block.STRUCT.unpack(self._block))
+        if self.mark != Block.MARK:
+            raise EOFError
+
+    @classmethod
+    def from_record(cls, record):
+        """Creates index entry from already unpacked record fields"""
+        block = cls.__new__(cls)
+        block._block = None
+        block._assign(record)
+        return block
+
+    def _assign(self, record):
         self.entry_size,\
             self.block_type,\
             self.stream_type,\
@@ -57,9 +192,7 @@ class Block:
             self.offset,\
             self.index,\
             self.block_id,\
-            self.mark = struct.unpack('=BBBQQQQIIQQQQH', self._block)
-        if self.mark != 0xbabe:
-            raise EOFError
+            self.mark = record
 
     def __repr__(self):
         return f'{self.__class__.__name__}(block_type={self.block_type})'
@@ -77,27 +210,177 @@ class Block:
         return self.block_size
 
 
+INDEX_DTYPE = numpy.dtype([(name, '=' + code) for name, code in
+                           zip(Block.FIELDS, ('u1', 'u1', 'u1', 'u8', 'u8', 'u8', 'u8',
+                                              'u4', 'u4', 'u8', 'u8', 'u8', 'u8', 'u2'))]) \
+    if numpy is not None else None
+
+
+class IndexTable:
+    """IStream3 index records loaded in bulk.
+       Records are kept in a packed numpy structured array if numpy is installed,
+       otherwise in a list of unpacked tuples"""
+    def __init__(self, records, positions):
+        self._records = records
+        self._positions = positions
+
+    @classmethod
+    def from_buffer(cls, buffer, first=0):
+        """Decodes index records from buffer. Decoding stops at the first record with broken mark"""
+        count = len(buffer) // Block.SIZE
+        if numpy is not None:
+            records = numpy.frombuffer(buffer, dtype=INDEX_DTYPE, count=count)
+            broken = numpy.flatnonzero(records['mark'] != Block.MARK)
+            if broken.size:
+                records = records[:broken[0]]
+            return cls(records, numpy.arange(first, first + len(records)))
+        records = []
+        for record in Block.STRUCT.iter_unpack(memoryview(buffer)[:count * Block.SIZE]):
+            if record[-1] != Block.MARK:
+                break
+            records.append(record)
+        return cls(records, list(range(first, first + len(records))))
+
+    @classmethod
+    def load(cls, path):
+        """Loads whole index file in one read"""
+        with HANDLES.handle(path) as index_file:
+            return cls.from_buffer(index_file.read())
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        records = self._records.tolist() if numpy is not None else self._records
+        for record in records:
+            yield Block.from_record(record)
+
+    @property
+    def positions(self):
+        """returns record positions in index file"""
+        return self._positions.tolist() if numpy is not None else self._positions
+
+    def column(self, name):
+        """returns values of record field by name"""
+        if numpy is not None:
+            return self._records[name]
+        field = Block.FIELDS.index(name)
+        return [record[field] for record in self._records]
+
+    def streams(self):
+        """returns block count and byte total per stream id"""
+        if numpy is not None:
+            ids, inverse = numpy.unique(self._records['stream_id'], return_inverse=True)
+            counts = numpy.bincount(inverse, minlength=len(ids))
+            sizes = numpy.zeros(len(ids), dtype=numpy.uint64)
+            numpy.add.at(sizes, inverse, self._records['block_size'])
+            return {stream_id: [blocks, size] for stream_id, blocks, size in
+                    zip(ids.tolist(), counts.tolist(), sizes.tolist())}
+        result = {}
+        for stream_id, size in zip(self.column('stream_id'), self.column('block_size')):
+            stream = result.setdefault(stream_id, [0, 0])
+            stream[0] += 1
+            stream[1] += size
+        return result
+
+    def select(self, mask):
+        """returns records masked by sequence of booleans"""
+        if numpy is not None:
+            return IndexTable(self._records[mask], self._positions[mask])
+        return IndexTable([record for record, keep in zip(self._records, mask) if keep],
+                          [position for position, keep in zip(self._positions, mask) if keep])
+
+    def head(self, count):
+        """returns first count records"""
+        return IndexTable(self._records[:count], self._positions[:count])
+
+    def until(self, stop):
+        """returns records preceding the first one with timestamp after stop"""
+        if not stop:
+            return self
+        if numpy is not None:
+            after = numpy.flatnonzero(self._records['timestamp'] > stop)
+            count = after[0] if after.size else len(self._records)
+        else:
+            timestamps = self.column('timestamp')
+            count = next((i for i, timestamp in enumerate(timestamps) if timestamp > stop), len(timestamps))
+        return IndexTable(self._records[:count], self._positions[:count])
+
+    def values(self, name):
+        """returns values of record field by name as list of python integers"""
+        if numpy is not None:
+            return self._records[name].tolist()
+        return self.column(name)
+
+    def where(self, stream_id=None, stream_types=(), begin=0, data_size=None, block_types=(), stream_ids=()):
+        """returns records of stream (or streams), of stream and block types,
+           not earlier than begin and inside data file"""
+        if numpy is not None:
+            mask = numpy.ones(len(self._records), dtype=bool)
+            if stream_id is not None:
+                mask &= self._records['stream_id'] == stream_id
+            if stream_ids:
+                mask &= numpy.isin(self._records['stream_id'], stream_ids)
+            if stream_types:
+                mask &= numpy.isin(self._records['stream_type'], stream_types)
+            if block_types:
+                mask &= numpy.isin(self._records['block_type'], block_types)
+            if begin:
+                mask &= self._records['timestamp'] >= begin
+            if data_size is not None:
+                mask &= self._records['offset'] < data_size
+            return self.select(mask)
+        fields = [Block.FIELDS.index(name)
+                  for name in ('stream_id', 'stream_type', 'timestamp', 'offset', 'block_type')]
+        mask = [(stream_id is None or record[fields[0]] == stream_id) and
+                (not stream_ids or record[fields[0]] in stream_ids) and
+                (not stream_types or record[fields[1]] in stream_types) and
+                (not block_types or record[fields[4]] in block_types) and
+                record[fields[2]] >= begin and
+                (data_size is None or record[fields[3]] < data_size) for record in self._records]
+        return self.select(mask)
+
+
 class IndexIterator:
-    """IStream3 index file iterator"""
+    """IStream3 index file iterator. Index file handle is given back to pool when iteration stops"""
     _file = None
+    _name = ''
     _end = 0
 
+    def __iter__(self):
+        return self
+
     def __next__(self):
         try:
             if self._file is not None:
                 block = Block(self._file)
                 if not self._end or block.timestamp <= self._end:
                     return block
-            raise StopIteration
         except EOFError:
-            raise StopIteration from None
+            pass
+        self.close()
+        raise StopIteration
+
+    def close(self):
+        """Gives index file handle back to pool"""
+        if self._file is not None:
+            HANDLES.release(self._name, self._file)
+            self._file = None
 
     def filename(self, name):
         """Sets IStream3 index filename"""
-        self._file = open(name, 'rb')
+        self.close()
+        self._name = name
+        self._file = HANDLES.acquire(name)
 
     filename = property(None, filename)
 
+    def start(self, position):
+        """Sets IStream3 index record position to iterate from"""
+        self._file.seek(position * Block.SIZE, 0)
+
+    start = property(None, start)
+
     def end(self, stop):
         """Sets IStream3 index timestamp to dump till"""
         self._end = stop
@@ -106,33 +389,200 @@ class IndexIterator:
 
 
 class Index:
-    """IStream3 index file"""
-    def __init__(self, path, last_timestamp):
+    """IStream3 index file. In context index keeps one pooled file handle for all its reads"""
+    def __init__(self, path, last_timestamp, first_timestamp=0):
         self._path = path
         self._last_timestamp = last_timestamp
+        self._first_timestamp = first_timestamp
+        self._file = None
+
+    def __enter__(self):
+        self._file = HANDLES.acquire(self._path)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        HANDLES.release(self._path, self._file)
+        self._file = None
+
+    @contextlib.contextmanager
+    def _open(self):
+        """Lends index file handle: the one held in context or pooled one"""
+        if self._file is not None:
+            yield self._file
+        else:
+            with HANDLES.handle(self._path) as index_file:
+                yield index_file
 
     @property
     def path(self):
         """returns IStream3 index file path"""
         return self._path
 
+    def __len__(self):
+        return os.path.getsize(self._path) // Block.SIZE
+
+    @staticmethod
+    def _timestamp_at(index_file, position):
+        """Returns timestamp of record at position or None if the record is broken"""
+        index_file.seek(position * Block.SIZE, 0)
+        try:
+            return Block(index_file).timestamp
+        except EOFError:
+            return None
+
+    @staticmethod
+    def _bisect(index_file, timestamp, count, after=False):
+        """Returns position of the first record with timestamp not earlier (or later if after) than timestamp.
+           Records are fixed-size and timestamp ordered, broken record is treated as the end of index"""
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            current = Index._timestamp_at(index_file, middle)
+            if current is not None and (current <= timestamp if after else current < timestamp):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def bounds(self):
+        """returns timestamps of the first and the last index file records or None if unknown"""
+        count = len(self)
+        if not count:
+            return None
+        with self._open() as index_file:
+            first = self._timestamp_at(index_file, 0)
+            last = self._timestamp_at(index_file, count - 1)
+        if first is None or last is None:
+            return None
+        return first, last
+
+    def block(self, position):
+        """returns index file record at position"""
+        with self._open() as index_file:
+            index_file.seek(position * Block.SIZE, 0)
+            return Block(index_file)
+
+    def bisect(self, timestamp):
+        """returns position of the first index file record not earlier than timestamp"""
+        with self._open() as index_file:
+            return self._bisect(index_file, timestamp, len(self))
+
+    def table(self):
+        """returns index file records from first till last timestamp loaded in one read"""
+        clock = STATS.clock() if STATS.enabled else 0
+        count = len(self)
+        with self._open() as index_file:
+            start = self._bisect(index_file, self._first_timestamp, count) if self._first_timestamp else 0
+            stop = self._bisect(index_file, self._last_timestamp, count, after=True) \
+                if self._last_timestamp else None
+            index_file.seek(start * Block.SIZE, 0)
+            buffer = index_file.read() if stop is None else index_file.read(max(stop - start, 0) * Block.SIZE)
+        table = IndexTable.from_buffer(buffer, start).until(self._last_timestamp)
+        if STATS.enabled:
+            STATS.elapsed('index', clock)
+            STATS.count('index_files')
+            STATS.count('index_records', len(table))
+        return table
+
     def __iter__(self):
         index_iterator = IndexIterator()
         index_iterator.filename = self._path
+        if self._first_timestamp:
+            index_iterator.start = self.bisect(self._first_timestamp)
         index_iterator.end = self._last_timestamp
         return index_iterator
 
 
 class Data:
-    """IStream3 data file"""
-    def __init__(self, path):
+    """IStream3 data file. Frames are read with seek and read calls
+       or taken as memoryview slices of memory mapped file"""
+    span_limit = 1 << 22
+
+    def __init__(self, path, mapped=False):
+        self._path = path
         self._size = os.path.getsize(path)
-        self._file_desc = open(path, 'rb')
+        self._file_desc = HANDLES.acquire(path)
+        self._map, self._view = None, None
+        if STATS.enabled:
+            STATS.count('data_files')
+        if mapped and self._size:
+            self._map = mmap.mmap(self._file_desc.fileno(), self._size, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
 
     def __len__(self):
         return self._size
 
-    def frame(self, block) -> bytes:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def fileno(self):
+        """Returns data file descriptor"""
+        return self._file_desc.fileno()
+
+    def close(self):
+        """Unmaps data file and gives its handle back to pool"""
+        if self._view is not None:
+            self._view.release()
+            try:
+                self._map.close()
+            except BufferError:
+                pass
+            self._map, self._view = None, None
+        if self._file_desc is not None:
+            HANDLES.release(self._path, self._file_desc)
+            self._file_desc = None
+
+    def advise(self, start=0, length=0):
+        """Advises kernel to read ahead data file region (to the end of file if length is 0)"""
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(self.fileno(), start, length, os.POSIX_FADV_WILLNEED)
+
+    def frame(self, block):
         """Returns data frame by index block offset and index block size"""
+        if self._view is not None:
+            return self._view[block.offset-len(block):block.offset]
+        clock = STATS.clock() if STATS.enabled else 0
         self._file_desc.seek(block.offset-len(block), 0)
-        return self._file_desc.read(len(block))
+        frame = self._file_desc.read(len(block))
+        if STATS.enabled:
+            STATS.elapsed('read', clock)
+            STATS.count('data_reads')
+            STATS.count('data_read_bytes', len(frame))
+        return frame
+
+    def frames(self, blocks):
+        """Yields index blocks with their data frames.
+           Frames of blocks adjacent in data file are read as one contiguous span"""
+        span, start, end = [], 0, 0
+        for block in blocks:
+            if span and block.offset-len(block) == end and block.offset - start <= self.span_limit:
+                span.append(block)
+                end = block.offset
+                continue
+            yield from self._split(span, start, end)
+            span, start, end = [block], block.offset-len(block), block.offset
+        yield from self._split(span, start, end)
+
+    def _split(self, span, start, end):
+        """Yields blocks of span with their frames sliced from span data"""
+        if not span:
+            return
+        if self._view is not None:
+            buffer = self._view
+            if len(span) > 1 and hasattr(self._map, 'madvise'):
+                page = start - start % mmap.PAGESIZE
+                self._map.madvise(mmap.MADV_WILLNEED, page, end - page)
+            start = 0
+        else:
+            clock = STATS.clock() if STATS.enabled else 0
+            self._file_desc.seek(start, 0)
+            buffer = memoryview(self._file_desc.read(end - start))
+            if STATS.enabled:
+                STATS.elapsed('read', clock)
+                STATS.count('data_reads')
+                STATS.count('data_read_bytes', len(buffer))
+        for block in span:
+            yield block, buffer[block.offset-len(block)-start:block.offset-start]
@@ -0,0 +1,107 @@
+"""Extracts many clips of IStream3 channel stream listed in ranges file
+   in one sequential pass over channel chunks"""
+import os
+from .dump import Dump, MultiDump, chunk_frames
+from .writer import Writer, open_dump
+
+
+def read_ranges(path):
+    """Returns (from, to, output) clips of ranges file: one clip per line with fields separated
+       by commas or spaces, empty lines and lines starting with # are skipped"""
+    clips = []
+    with open(path) as ranges:
+        for number, line in enumerate(ranges, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.replace(',', ' ').split(None, 2)
+            if len(fields) != 3:
+                raise ValueError('{}:{}: expected from, to, output'.format(path, number))
+            clips.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    return clips
+
+
+class Clips(MultiDump):
+    """Dumps clips of channel stream, overlapping or not. Clip ranges are merged into sorted windows
+       swept once, every frame read is written by each clip whose range contains it.
+       Clips start as single dumps do: video with IDR preceded by SPS and PPS"""
+    @staticmethod
+    def make_options(options):
+        """Returns keyword arguments of clips dump with clips listed in ranges file of options"""
+        kwargs = MultiDump.make_options(options)
+        kwargs['clips'] = read_ranges(options['clips'])
+        return kwargs
+
+    @staticmethod
+    def create(dump_dir, channel, **kwargs):
+        """Creates extractor with dumper of every (from, to, output) clip of clips, relative outputs
+           are placed to dump_dir. Raises IOError if clip output exists and override is not set"""
+        dumpers = []
+        for begin, end, path in kwargs.get('clips', ()):
+            path = os.path.join(dump_dir, path)
+            if not kwargs.get('override') and os.path.exists(path):
+                raise IOError(path)
+            dumper = Dump.create(path, channel, range=(begin, end),
+                                 **Clips.dumper_options(kwargs, 'clips', 'range'))
+            if dumper is None:
+                raise IOError('unsupported encoding of stream {}'.format(kwargs.get('stream_id', 0)))
+            dumpers.append(dumper)
+        return Clips(channel, dumpers, **kwargs)
+
+    def __init__(self, channel, dumpers, **kwargs):
+        super().__init__(channel, **kwargs)
+        self._dumpers = dumpers
+        self._stream_id = kwargs.get('stream_id', 0)
+
+    @property
+    def dumpers(self):
+        """Clip dumpers getter"""
+        return list(self._dumpers)
+
+    @staticmethod
+    def windows(ranges):
+        """Returns sorted (from, to) windows merged of overlapping ranges, 0 stands for open end"""
+        merged = []
+        for begin, end in sorted(ranges):
+            if merged and (not merged[-1][1] or begin <= merged[-1][1]):
+                if merged[-1][1] and (not end or end > merged[-1][1]):
+                    merged[-1][1] = end
+            else:
+                merged.append([begin, end])
+        return [tuple(window) for window in merged]
+
+    def write(self):
+        """Dumps every clip to its own file"""
+        writers = []
+        try:
+            for dumper in self._dumpers:
+                file = open_dump(dumper.filename)
+                writers.append(Writer(file, **dumper.writer_options))
+                dumper.write_tag(writers[-1])
+                dumper.seek(writers[-1])
+            self.write_chunks(writers)
+        finally:
+            for writer in writers:
+                writer.close()
+                writer.file.close()
+
+    def write_chunks(self, writers):
+        """Sweeps merged windows of clips ranges fanning frames out to clips writers.
+           Frames are shared by writers, so they are written from memory rather than copied from data files"""
+        clips = sorted(zip(self._dumpers, writers), key=lambda clip: clip[0].range[0])
+        pending, active = 0, []
+        for begin, end in self.windows([dumper.range for dumper in self._dumpers]):
+            for _, frames in chunk_frames(self._channel.chunks, (self._stream_id,), begin, end,
+                                          **self._chunk_options):
+                for blk, frame in frames:
+                    while pending < len(clips) and clips[pending][0].range[0] <= blk.timestamp:
+                        active.append(clips[pending])
+                        pending += 1
+                    active = [clip for clip in active
+                              if not clip[0].range[1] or blk.timestamp <= clip[0].range[1]]
+                    for dumper, writer in active:
+                        dumper.on_block(writer, blk, frame)
+                for writer in writers:
+                    writer.flush()
+        for dumper in self._dumpers:
+            dumper.finish()
@@ -1,10 +1,168 @@
 """Dumps stream from IStream3 channel by id"""
 import os
 import sys
+import threading
+from queue import Queue, Full
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from enum import IntEnum
 from .id3 import Tag, Frame
-from .channel import Index, Channel, Data
+from .channel import Block, Index, Data, HANDLES
 from .adts import Header as AudioDataTsHeader
+from .summary import Summary
+from .catalog import open_channel
+from .writer import Writer, open_dump
+from .ts import Muxer, StreamType
+from .stats import STATS
+
+
+def chunk_bounds(chunk):
+    """Returns timestamps of the first and the last chunk records taken from cached summary
+       or read from index file, None if chunk is empty"""
+    summary = Summary.cached(chunk)
+    return summary.bounds if summary is not None else Index(chunk, 0).bounds()
+
+
+def chunk_overlaps(chunk, stream_ids, begin=0, end=0):
+    """Checks if chunk timestamps intersect range and, if its summary is already cached, chunk has blocks
+       of streams. Otherwise timestamps of the first and the last index records are read"""
+    summary = Summary.cached(chunk)
+    bounds = summary.bounds if summary is not None else Index(chunk, 0).bounds()
+    overlaps = bounds is not None and (not end or bounds[0] <= end) and bounds[1] >= begin and \
+        (summary is None or bool(set(stream_ids) & set(summary.streams)))
+    if STATS.enabled:
+        STATS.count('chunks_opened' if overlaps else 'chunks_skipped')
+        if not overlaps and summary is not None:
+            STATS.count('skipped_bytes', sum(stream['bytes'] for stream in summary.streams.values()))
+    return overlaps
+
+
+def chunk_blocks(chunk, data, stream_ids, begin=0, end=0):
+    """Returns index blocks of streams in range with frames inside data file"""
+    table = Index(chunk, end, begin).table()
+    blocks = table.where(stream_ids=stream_ids, begin=begin, data_size=len(data))
+    if STATS.enabled:
+        STATS.count('skipped_bytes', sum(table.values('block_size')) - sum(blocks.values('block_size')))
+    return blocks
+
+
+def extract_chunk(chunk, stream_ids, begin=0, end=0):
+    """Returns index blocks of streams in range with their frames read from chunk into memory"""
+    if not chunk_overlaps(chunk, stream_ids, begin, end):
+        return []
+    with Data(chunk.rstrip(".idx")) as data:
+        return list(data.frames(chunk_blocks(chunk, data, stream_ids, begin, end)))
+
+
+def read_ahead_frames(chunks, stream_ids, begin=0, end=0, buffers=4):
+    """Yields None and index blocks of streams in range with their frames for every chunk overlapping range.
+       Frames are read by reader thread into up to buffers batches queued ahead of consumer, the next
+       chunk data file is advised to be read by kernel meanwhile. Chunk frames must be consumed
+       before the next chunk"""
+    queue, stop = Queue(buffers), threading.Event()
+    chunk_end = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            selected = [chunk for chunk in chunks if chunk_overlaps(chunk, stream_ids, begin, end)]
+            for number, chunk in enumerate(selected):
+                for ahead in selected[number:number + 2] if number == 0 else selected[number + 1:number + 2]:
+                    with Data(ahead.rstrip(".idx")) as data:
+                        data.advise()
+                with Data(chunk.rstrip(".idx")) as data:
+                    batch, size = [], 0
+                    for blk, frame in data.frames(chunk_blocks(chunk, data, stream_ids, begin, end)):
+                        batch.append((blk, frame))
+                        size += len(frame)
+                        if size >= Data.span_limit:
+                            if not put(batch):
+                                return
+                            batch, size = [], 0
+                    if not put(batch) or not put(chunk_end):
+                        return
+        except Exception as error:  # reraised by consumer
+            put(error)
+        put(None)
+
+    def frames(batch):
+        while batch is not chunk_end:
+            if isinstance(batch, Exception):
+                raise batch
+            yield from batch
+            batch = queue.get()
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            batch = queue.get()
+            if batch is None:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            yield None, frames(batch)
+    finally:
+        stop.set()
+        thread.join()
+
+
+def mapped_frames(chunks, stream_ids, begin=0, end=0):
+    """Yields memory mapped data file and index blocks of streams in range with their frames
+       for every chunk overlapping range"""
+    for chunk in chunks:
+        if not chunk_overlaps(chunk, stream_ids, begin, end):
+            continue
+        with Data(chunk.rstrip(".idx"), mapped=True) as data:
+            yield data, data.frames(chunk_blocks(chunk, data, stream_ids, begin, end))
+
+
+def parallel_frames(chunks, stream_ids, begin=0, end=0, jobs=2, memory_budget=1 << 28):
+    """Yields None and index blocks of streams in range with their frames for every chunk overlapping range.
+       Chunks are extracted in thread pool keeping no more than memory budget of frames in flight
+       and yielded in chunks order. Chunk frames are sized by cached summary or by data file size"""
+    with ThreadPoolExecutor(jobs) as pool:
+        pending, reserved = deque(), 0
+        for chunk in chunks:
+            summary = Summary.cached(chunk)
+            if summary is not None:
+                streams = summary.streams
+                size = sum(streams[stream_id]['bytes'] for stream_id in stream_ids if stream_id in streams)
+            else:
+                size = os.path.getsize(chunk.rstrip(".idx"))
+            while pending and (len(pending) >= jobs or reserved + size > memory_budget):
+                future, taken = pending.popleft()
+                reserved -= taken
+                yield None, future.result()
+            pending.append((pool.submit(extract_chunk, chunk, stream_ids, begin, end), size))
+            reserved += size
+        while pending:
+            yield None, pending.popleft()[0].result()
+
+
+def chunk_frames(chunks, stream_ids, begin=0, end=0, jobs=1, memory_budget=1 << 28, read_ahead=0):
+    """Yields data file frames are taken from (None if frames are in memory) and index blocks
+       of streams in range with their frames for every chunk overlapping range: memory mapped,
+       extracted by several jobs or read ahead by reader thread. Pooled handles of chunks files
+       are closed when iteration ends"""
+    try:
+        if jobs > 1:
+            yield from parallel_frames(chunks, stream_ids, begin, end, jobs, memory_budget)
+        elif read_ahead > 0:
+            yield from read_ahead_frames(chunks, stream_ids, begin, end, read_ahead)
+        else:
+            yield from mapped_frames(chunks, stream_ids, begin, end)
+    finally:
+        for chunk in chunks:
+            HANDLES.close(chunk.rstrip(".idx"))
 
 
 def id3(cls):
@@ -20,49 +178,88 @@ def id3(cls):
 
         def write(self):
             """Redefined dump function of base class to add id3 tag to dump file"""
-            with open(super().filename, 'wb') as file:
-                self._tag = Tag()
-                self._tag.add_frame(Frame(id='TPUB', content='IStream'))
-                self._tag.add_frame(Frame(id='TIT2', content=super().channel_id))
-                file.write(self._tag.encode())
-                super().write_chunks(file)
+            with open_dump(super().filename) as file:
+                self.write_to(file)
+
+        def write_to(self, file):
+            """Dumps with id3 tag to open file object"""
+            with Writer(file, **self._writer_options) as writer:
+                self.write_tag(writer)
+                super().write_chunks(writer)
+
+        def write_tag(self, writer):
+            """Writes id3 tag to dump file"""
+            self._tag = self._make_tag()
+            writer.write(self._tag.encode())
+
+        def tag_size(self):
+            """Returns size of id3 tag written to dump file"""
+            return len(self._make_tag().encode())
+
+        def _make_tag(self):
+            tag = Tag()
+            tag.add_frame(Frame(id='TPUB', content='IStream'))
+            tag.add_frame(Frame(id='TIT2', content=super().channel_id))
+            return tag
     return Id3Inserter
 
 
+def iter_frames(channel_path, stream_id=0, dump_range=()):
+    """Lazily yields (index block, frame) pairs of channel stream in dump range (from, to).
+       Frames are memoryview slices of memory mapped data files"""
+    channel = open_channel(channel_path, stream_id)
+    begin = Dump.set_range_limit(dump_range[0]) if len(dump_range) > 0 else 0
+    end = Dump.set_range_limit(dump_range[1]) if len(dump_range) > 1 else 0
+    for data, frames in chunk_frames(channel.chunks, (stream_id,), begin, end):
+        yield from frames
+
+
+CHUNK_OPTIONS = ('jobs', 'memory_budget', 'read_ahead')
+WRITER_OPTIONS = ('flush_size', 'copy_threshold', 'throttle')
+
+
 @id3
 class Dump:
     """IStream3 channel dumper - dumps a channel stream by id"""
+    _overhead = 0
+
     @staticmethod
     def make(*params):
         """Creates Dumper object according to encoding name"""
         channel_path, stream_id, dump_path, dump_range, override, verb, *left = params
         channel_id = channel_path.split('/')[-1]
+        options = left[0] if left else {}
         try:
-            channel = Channel(channel_path, stream_id)
-            enc = channel.search('encoding')
+            channel = open_channel(channel_path, stream_id)
             if len(dump_path) == 0:
-                dump_path = channel_id + '.' + enc
-            if not override and os.path.exists(dump_path):
+                dump_path = channel_id + '.' + channel.search('encoding')
+            resumed = options.get('follow') and os.path.exists(dump_path + '.checkpoint')
+            if not override and not resumed and dump_path != '-' and os.path.exists(dump_path):
                 raise IOError(dump_path)
-            dumper = None
-            if enc == 'aac':
-                dumper = AacDump(dump_path, channel,
-                                 channel_id=channel_id,
-                                 config=int(channel.search('fmtp').split('config=')[1][:4], 16),
-                                 stream_id=stream_id,
-                                 range=dump_range,
-                                 verbose=verb)
-            elif enc == 'h264':
-                dumper = AnnexBDump(dump_path, channel,
-                                    channel_id=channel_id,
-                                    stream_id=stream_id,
-                                    range=dump_range,
-                                    verbose=verb)
-            return dumper
+            return Dump.create(dump_path, channel,
+                               channel_id=channel_id,
+                               stream_id=stream_id,
+                               range=dump_range,
+                               verbose=verb,
+                               jobs=options.get('jobs', 1),
+                               read_ahead=options.get('read_ahead', 0))
         except IOError as io_error:
             print('invalid path: ', io_error)
             sys.exit()
 
+    @staticmethod
+    def create(dump_path, channel, **kwargs):
+        """Creates Dumper object of channel stream according to its encoding name"""
+        stream_id = kwargs.get('stream_id', 0)
+        enc = channel.search('encoding', stream_id)
+        if enc == 'aac':
+            return AacDump(dump_path, channel,
+                           config=int(channel.search('fmtp', stream_id).split('config=')[1][:4], 16),
+                           **kwargs)
+        if enc == 'h264':
+            return AnnexBDump(dump_path, channel, **kwargs)
+        return None
+
     @staticmethod
     def set_range_limit(range_limit):
         s = str(range_limit)
@@ -79,6 +276,10 @@ class Dump:
         self._begin = self.set_range_limit(dump_range[0]) if len(dump_range) > 0 else 0
         self._end = self.set_range_limit(dump_range[1]) if len(dump_range) > 1 else 0
         self._verbose = kwargs.get('verbose', False)
+        self._log = kwargs.get('log', sys.stderr if filename == '-' else sys.stdout)
+        self._writer_options = {key: kwargs[key] for key in WRITER_OPTIONS if key in kwargs}
+        self._chunk_options = {key: kwargs[key] for key in CHUNK_OPTIONS if key in kwargs}
+        self._written_range = [0, 0]
 
     @property
     def channel_id(self):
@@ -90,38 +291,313 @@ class Dump:
         """Filename field setter"""
         return self._filename
 
+    @property
+    def stream_id(self):
+        """Stream ID field getter"""
+        return self._stream_id
+
+    @property
+    def channel(self):
+        """Dumped channel getter"""
+        return self._channel
+
+    @property
+    def range(self):
+        """Dump range (from, to) getter"""
+        return self._begin, self._end
+
+    @property
+    def writer_options(self):
+        """Dump file writer keyword arguments"""
+        return self._writer_options
+
+    @property
+    def chunk_options(self):
+        """Chunk extraction keyword arguments"""
+        return self._chunk_options
+
     def write(self):
         """abstract method redefined in id3 decorator with main goal to call write_chunks method"""
 
-    def _write_block(self, file, data, duration):
+    def write_tag(self, writer):
+        """abstract method redefined in id3 decorator"""
+
+    def tag_size(self):
+        """abstract method redefined in id3 decorator"""
+        return 0
+
+    def _write_block(self, file, data, blk):
         pass
 
+    def on_block(self, file, blk, frame):
+        """dumps frame of index block"""
+        if not self._written_range[0]:
+            self._written_range[0] = blk.timestamp
+        if self._verbose:
+            self._log.write('{}\n'.format(blk))
+        if STATS.enabled:
+            STATS.count('blocks')
+            STATS.count('bytes', len(frame))
+        self._write_block(file, frame, blk)
+        self._written_range[1] = blk.timestamp
+
+    def finish(self):
+        """sets dump range to really written one"""
+        self._begin, self._end = self._written_range
+
+    def state(self):
+        """returns dump state to be restored on resumed dump"""
+        return {'written_range': self._written_range}
+
+    def restore(self, state):
+        """restores dump state saved on previous dump"""
+        self._written_range = state['written_range']
+
+    def seek(self, file):
+        """prepares dump range start, redefined in subclasses"""
+
+    def plan(self):
+        """Returns estimate of dump computed from index records only: written range, number of blocks
+           and frames, duration and size. Data files are never opened. Planned dumper reports no summary"""
+        self._log = None
+        begin, parameter_sets = self._start()
+        estimate = {'channel': self._channel_id, 'filename': self._filename, 'stream': self._stream_id,
+                    'encoding': self._channel.search('encoding', self._stream_id),
+                    'range': [0, 0], 'blocks': 0, 'frames': 0, 'duration': 0, 'bytes': self.tag_size()}
+        blocks = [Index(chunk, 0).block(position) for chunk, position in parameter_sets]
+        for chunk in self._channel.chunks:
+            if not chunk_overlaps(chunk, (self._stream_id,), begin, self._end):
+                continue
+            table = Index(chunk, self._end, begin).table()
+            selected = table.where(stream_id=self._stream_id, begin=begin,
+                                   data_size=os.path.getsize(chunk.rstrip(".idx")))
+            if len(selected):
+                timestamps = selected.values('timestamp')
+                estimate['range'] = [estimate['range'][0] or timestamps[0], timestamps[-1]]
+            blocks.append(selected)
+        for size, duration, frame in self._planned(blocks):
+            estimate['blocks'] += 1
+            estimate['frames'] += frame
+            estimate['duration'] += duration
+            estimate['bytes'] += size
+        return estimate
+
+    def _start(self):
+        """Returns dump range start and (chunk, position) of index records written before it"""
+        return self._begin, []
+
+    def _planned(self, blocks):
+        """Yields size with header, duration and frame flag of every written block of blocks and tables"""
+        for table in blocks:
+            for size, duration in zip(table.values('block_size'), table.values('duration')):
+                yield size + self._overhead, duration, 1
+
+    def splittable(self, frame):
+        """checks if dump can be split into segments before frame"""
+        return True
+
+    def start_segment(self, file, frame):
+        """prepares segment starting with frame, redefined in subclasses"""
+
     def write_chunks(self, file):
         """dumps stream chunks from channel"""
-        written_range = [0, 0]
-        for chunk in self._channel.chunks:
-            data = Data(chunk.rstrip(".idx"))
-            for blk in Index(chunk, self._end):
-                if blk.stream_id == self._stream_id and blk.offset < len(data):
-                    if blk.timestamp >= self._begin:
-                        if not written_range[0]:
-                            written_range[0] = blk.timestamp
-                        if self._verbose:
-                            print('{}'.format(blk))
-                        self._write_block(file, data.frame(blk), blk.duration)
-                        written_range[1] = blk.timestamp
-        self._begin, self._end = written_range
+        self.seek(file)
+        for data, frames in chunk_frames(self._channel.chunks, (self._stream_id,), self._begin, self._end,
+                                         **self._chunk_options):
+            file.source = data
+            for blk, frame in frames:
+                self.on_block(file, blk, frame)
+            file.flush()
+            file.source = None
+        self.finish()
+
+
+class MultiDump:
+    """Base of dumps made by several stream dumpers in one pass over channel chunks"""
+    excluded = ('override',) + CHUNK_OPTIONS
+
+    @classmethod
+    def make(cls, *params):
+        """Creates dump according to command line parameters"""
+        channel_path, stream_id, dump_path, dump_range, override, verb, *left = params
+        options = left[0] if left else {}
+        try:
+            return cls.create(dump_path, open_channel(channel_path, stream_id),
+                              channel_id=channel_path.split('/')[-1],
+                              stream_id=stream_id,
+                              override=override,
+                              range=dump_range,
+                              verbose=verb,
+                              **cls.make_options(options))
+        except (IOError, ValueError) as error:
+            print('invalid path: ', error)
+            sys.exit()
+
+    @staticmethod
+    def make_options(options):
+        """Returns keyword arguments of dump taken from command line options"""
+        return {'jobs': options.get('jobs', 1), 'read_ahead': options.get('read_ahead', 0)}
+
+    @classmethod
+    def dumper_options(cls, kwargs, *excluded):
+        """Returns keyword arguments of dump passed to its stream dumpers"""
+        return {key: value for key, value in kwargs.items() if key not in cls.excluded + excluded}
+
+    def __init__(self, channel, **kwargs):
+        self._channel = channel
+        dump_range = kwargs.get('range', ())
+        self._begin = Dump.set_range_limit(dump_range[0]) if len(dump_range) > 0 else 0
+        self._end = Dump.set_range_limit(dump_range[1]) if len(dump_range) > 1 else 0
+        self._chunk_options = {key: kwargs[key] for key in CHUNK_OPTIONS if key in kwargs}
+
+
+class Demux(MultiDump):
+    """IStream3 channel demultiplexer - dumps all channel streams in one pass over channel chunks"""
+    @staticmethod
+    def create(dump_dir, channel, **kwargs):
+        """Creates demultiplexer with dumper of every channel stream of known encoding to files in dump_dir.
+           Raises IOError if dump file exists and override is not set"""
+        channel_id = kwargs.get('channel_id', os.path.basename(channel.path.rstrip('/')))
+        paths = {sid: os.path.join(dump_dir, channel_id + '.' + str(sid) + '.' + channel.search('encoding', sid))
+                 for sid in channel.stream_ids}
+        for path in paths.values():
+            if not kwargs.get('override') and os.path.exists(path):
+                raise IOError(path)
+        dumpers = []
+        for sid, path in paths.items():
+            dumper = Dump.create(path, channel,
+                                 channel_id=channel_id,
+                                 stream_id=sid,
+                                 **Demux.dumper_options(kwargs, 'channel_id', 'stream_id'))
+            if dumper is not None:
+                dumpers.append(dumper)
+        return Demux(channel, dumpers, **kwargs)
+
+    def __init__(self, channel, dumpers, **kwargs):
+        super().__init__(channel, **kwargs)
+        self._dumpers = {dumper.stream_id: dumper for dumper in dumpers}
+
+    @property
+    def dumpers(self):
+        """Stream dumpers getter"""
+        return list(self._dumpers.values())
+
+    def plan(self):
+        """Returns estimates of every stream dump computed from index records only"""
+        return [dumper.plan() for dumper in self._dumpers.values()]
+
+    def write(self):
+        """dumps every stream to its own file routing index blocks by stream id"""
+        writers = {}
+        try:
+            for stream_id, dumper in self._dumpers.items():
+                file = open(dumper.filename, 'wb')
+                writers[stream_id] = Writer(file, **dumper.writer_options)
+                dumper.write_tag(writers[stream_id])
+            self.write_chunks(writers)
+        finally:
+            for writer in writers.values():
+                writer.close()
+                writer.file.close()
+
+    def write_chunks(self, writers):
+        """dumps streams chunks from channel"""
+        for stream_id, dumper in self._dumpers.items():
+            dumper.seek(writers[stream_id])
+        begin = min([dumper.range[0] for dumper in self._dumpers.values()] + [self._begin])
+        for data, frames in chunk_frames(self._channel.chunks, tuple(self._dumpers), begin, self._end,
+                                         **self._chunk_options):
+            for writer in writers.values():
+                writer.source = data
+            for blk, frame in frames:
+                dumper = self._dumpers[blk.stream_id]
+                if blk.timestamp >= dumper.range[0]:
+                    dumper.on_block(writers[blk.stream_id], blk, frame)
+            for writer in writers.values():
+                writer.flush()
+                writer.source = None
+        for dumper in self._dumpers.values():
+            dumper.finish()
+
+
+class TsDump(MultiDump):
+    """IStream3 channel multiplexer - muxes h264 and aac channel streams into one MPEG transport stream
+       in a single pass. Stream dumpers write their frames to transport stream collectors"""
+    stream_types = {'h264': StreamType.H264, 'aac': StreamType.AAC}
+
+    @staticmethod
+    def create(dump_path, channel, **kwargs):
+        """Creates multiplexer of every channel stream of known encoding to dump_path
+           (def. <channel_id>.ts). Raises IOError if dump file exists and override is not set"""
+        if len(dump_path) == 0:
+            dump_path = kwargs.get('channel_id', os.path.basename(channel.path.rstrip('/'))) + '.ts'
+        if not kwargs.get('override') and dump_path != '-' and os.path.exists(dump_path):
+            raise IOError(dump_path)
+        dumpers = []
+        for sid in [sid for sid in channel.stream_ids if channel.search('encoding', sid) in TsDump.stream_types]:
+            dumper = Dump.create(dump_path, channel, stream_id=sid, **TsDump.dumper_options(kwargs, 'stream_id'))
+            if dumper is not None:
+                dumpers.append(dumper)
+        return TsDump(dump_path, channel, dumpers, **kwargs)
+
+    def __init__(self, filename, channel, dumpers, **kwargs):
+        super().__init__(channel, **kwargs)
+        self._filename = filename
+        self._dumpers = {dumper.stream_id: dumper for dumper in dumpers}
+        self._writer_options = {key: kwargs[key] for key in WRITER_OPTIONS if key in kwargs}
+
+    @property
+    def filename(self):
+        """Filename field getter"""
+        return self._filename
+
+    @property
+    def dumpers(self):
+        """Stream dumpers getter"""
+        return list(self._dumpers.values())
+
+    def write(self):
+        """muxes channel streams to transport stream file"""
+        with open_dump(self._filename) as file, Writer(file, **self._writer_options) as writer:
+            self.write_chunks(writer)
+
+    def write_chunks(self, writer):
+        """muxes streams chunks from channel routing index blocks to stream collectors by stream id"""
+        muxer = Muxer(writer, [self.stream_types[self._channel.search('encoding', stream_id)]
+                               for stream_id in self._dumpers])
+        streams = {stream_id: muxer.stream(number) for number, stream_id in enumerate(self._dumpers)}
+        for stream_id, dumper in self._dumpers.items():
+            dumper.seek(streams[stream_id])
+        begin = min([dumper.range[0] for dumper in self._dumpers.values()] + [self._begin])
+        for data, frames in chunk_frames(self._channel.chunks, tuple(self._dumpers), begin, self._end,
+                                         **self._chunk_options):
+            for blk, frame in frames:
+                dumper = self._dumpers[blk.stream_id]
+                if blk.timestamp >= dumper.range[0]:
+                    dumper.on_block(streams[blk.stream_id], blk, frame)
+            writer.flush()
+        for stream_id, dumper in self._dumpers.items():
+            streams[stream_id].flush()
+            dumper.finish()
 
 
 class AacDump(Dump):
     """Dumps aac stream with audio data transport stream header"""
+    _overhead = 7
+
     def __init__(self, filename, channel, **kwargs):
         super().__init__(filename, channel, **kwargs)
         self._config = kwargs.get('config', 0)
+        self._header = AudioDataTsHeader(config=self._config)
 
-    def _write_block(self, file, data, duration):
-        file.write(AudioDataTsHeader(config=self._config).encode(len(data)))
-        file.write(data)
+    def _write_block(self, file, data, blk):
+        if STATS.enabled:
+            clock = STATS.clock()
+            header = self._header.encode(len(data))
+            STATS.elapsed('encode', clock)
+        else:
+            header = self._header.encode(len(data))
+        file.write_frame(header, data, blk)
 
 
 class UnitType(IntEnum):
@@ -134,28 +610,134 @@ class UnitType(IntEnum):
 class AnnexBDump(Dump):
     """Dumps h264 stream with annexB divider"""
     _divider = b'\x00\x00\x00\x01'
+    _overhead = len(_divider)
     _sps_dumped, _pps_dumped = False, False
 
     def __init__(self, filename, channel, **kwargs):
         super().__init__(filename, channel, **kwargs)
         self._counter = 0
         self._duration = 0.
+        self._parameter_sets = {}
 
     def __del__(self):
-        print(f'DUMP from={self._begin}; to={self._end}; count={self._counter}; duration={self._duration} msec.')
+        if self._log is not None:
+            print(f'DUMP from={self._begin}; to={self._end}; count={self._counter}; '
+                  f'duration={self._duration} msec.', file=self._log)
+
+    def seek(self, file):
+        """Snaps dump range start to the IDR of the GOP it falls in or, past a gap, to the next IDR
+           found by index summaries. The latest SPS and PPS preceding the IDR are written first
+           so dump starts decodable"""
+        self._begin, parameter_sets = self._start()
+        for chunk, position in parameter_sets:
+            blk = Index(chunk, 0).block(position)
+            with Data(chunk.rstrip(".idx")) as data:
+                self._write_block(file, data.frame(blk), blk)
+
+    def _keyframes(self, chunk):
+        """Returns (chunk, position, timestamp) of stream IDR records of chunk"""
+        return [(chunk, position, timestamp) for position, timestamp, stream_id in Summary.load(chunk).keyframes
+                if stream_id == self._stream_id]
 
-    def _write_block(self, file, data, duration):
+    def _start(self):
+        """Returns timestamp of IDR dump starts with and (chunk, position) of the latest SPS and PPS
+           preceding it which are earlier than it, later ones are in dump range already.
+           Chunk holding range start is bisected by chunk bounds. Range start snaps back to the preceding IDR
+           of the same or previous chunk if it is at most one GOP (median IDR interval) before range start,
+           forward to the next IDR of the same or next chunk otherwise. Range start is kept without IDR found"""
+        if not self._begin:
+            return self._begin, []
+        chunks = self._channel.chunks
+        bounds = chunk_bounds(chunks[-1]) if chunks else None
+        if bounds is None or bounds[1] < self._begin:
+            return self._begin, []
+        low, high = 0, len(chunks)
+        while low < high:
+            middle = (low + high) // 2
+            bounds = chunk_bounds(chunks[middle])
+            if bounds is None or bounds[0] <= self._begin:
+                low = middle + 1
+            else:
+                high = middle
+        number = max(low - 1, 0)
+        keyframes = self._keyframes(chunks[number])
+        if number and not any(keyframe[2] <= self._begin for keyframe in keyframes):
+            keyframes = self._keyframes(chunks[number - 1]) + keyframes
+        if number + 1 < len(chunks) and not any(keyframe[2] >= self._begin for keyframe in keyframes):
+            keyframes += self._keyframes(chunks[number + 1])
+        preceding = [keyframe for keyframe in keyframes if keyframe[2] <= self._begin]
+        following = [keyframe for keyframe in keyframes if keyframe[2] >= self._begin]
+        intervals = sorted(later[2] - earlier[2] for earlier, later in zip(keyframes, keyframes[1:]))
+        gop = intervals[len(intervals) // 2] if intervals else 0
+        if preceding and (not gop or self._begin - preceding[-1][2] <= gop):
+            keyframe = preceding[-1]
+        elif following:
+            keyframe = following[0]
+        else:
+            return self._begin, []
+        number = chunks.index(keyframe[0])
+        parameter_sets = []
+        for key in ('sps', 'pps'):
+            position = keyframe[1]
+            for chunk in reversed(chunks[:number + 1]):
+                found = Summary.load(chunk).last(key, self._stream_id, position=position)
+                if found is not None:
+                    parameter_sets.append((chunk, found))
+                    break
+                position = None
+        return keyframe[2], [(chunk, found[0]) for chunk, found in parameter_sets if found[1] < keyframe[2]]
+
+    def _planned(self, blocks):
+        """Yields size with divider, duration and frame flag of blocks passing parameter sets gating"""
+        sps, pps = self._sps_dumped, self._pps_dumped
+        for table in blocks:
+            if isinstance(table, Block):
+                sps, pps = sps or table.block_type == UnitType.SPS, pps or table.block_type == UnitType.PPS
+                yield len(table) + self._overhead, table.duration, 0
+                continue
+            for unit, size, duration in zip(table.values('block_type'), table.values('block_size'),
+                                            table.values('duration')):
+                sps, pps = sps or unit == UnitType.SPS, pps or unit == UnitType.PPS
+                if unit > UnitType.IDR or (sps and pps):
+                    yield size + self._overhead, duration, int(unit <= UnitType.IDR)
+
+    def _write_block(self, file, data, blk):
         slice_type = int(data[0] & 0x1f)
         if slice_type == UnitType.SPS:
             self._sps_dumped = True
+            self._parameter_sets[UnitType.SPS] = bytes(data)
         elif slice_type == UnitType.PPS:
             self._pps_dumped = True
+            self._parameter_sets[UnitType.PPS] = bytes(data)
         if slice_type > UnitType.IDR or self._ready_to_write():
-            file.write(self._divider)
-            file.write(data)
+            file.write_frame(self._divider, data, blk)
             if slice_type <= UnitType.IDR:
                 self._counter += 1
-            self._duration += duration
+            self._duration += blk.duration
+
+    def splittable(self, frame):
+        """checks if segment can start with frame: SPS or IDR"""
+        return int(frame[0] & 0x1f) in (UnitType.SPS, UnitType.IDR)
+
+    def start_segment(self, file, frame):
+        """repeats the latest SPS and PPS at the head of segment starting with IDR"""
+        if int(frame[0] & 0x1f) == UnitType.IDR:
+            for unit in (UnitType.SPS, UnitType.PPS):
+                if unit in self._parameter_sets:
+                    file.write(self._divider, self._parameter_sets[unit])
+
+    def state(self):
+        """returns dump state with parameter sets and counters"""
+        state = super().state()
+        state.update(sps_dumped=self._sps_dumped, pps_dumped=self._pps_dumped,
+                     counter=self._counter, duration=self._duration)
+        return state
+
+    def restore(self, state):
+        """restores dump state with parameter sets and counters"""
+        super().restore(state)
+        self._sps_dumped, self._pps_dumped = state['sps_dumped'], state['pps_dumped']
+        self._counter, self._duration = state['counter'], state['duration']
 
     def _ready_to_write(self):
         """Checks if block can be dumped"""
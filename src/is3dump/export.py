@@ -0,0 +1,129 @@
+"""Exports IStream3 channel index records decoded in bulk as columns for analytics: NumPy npz or npy,
+   Parquet if pyarrow is installed, CSV otherwise. Per second aggregates of every stream are optional"""
+import os
+import csv
+import time
+from .channel import Block, Channel, IndexTable, numpy
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+COLUMNS = ('chunk', 'position') + tuple(name for name in Block.FIELDS if name not in ('entry_size', 'mark'))
+AGGREGATES = ('stream_id', 'second', 'blocks', 'bytes', 'duration', 'keyframes', 'max_gap')
+FORMATS = ('parquet', 'npz', 'npy', 'csv')
+
+
+def load_columns(chunks):
+    """Returns columns of index records of all chunks with chunk number and record position in chunk"""
+    tables = [IndexTable.load(chunk) for chunk in chunks]
+    if numpy is not None:
+        columns = {'chunk': numpy.repeat(numpy.arange(len(tables), dtype=numpy.uint32),
+                                         [len(table) for table in tables]),
+                   'position': numpy.concatenate([numpy.arange(len(table), dtype=numpy.uint64)
+                                                  for table in tables] or [numpy.zeros(0, numpy.uint64)])}
+        for name in COLUMNS[2:]:
+            columns[name] = numpy.concatenate([table.column(name) for table in tables] or
+                                              [numpy.zeros(0, numpy.uint64)])
+        return columns
+    columns = {'chunk': [number for number, table in enumerate(tables) for _ in range(len(table))],
+               'position': [position for table in tables for position in range(len(table))]}
+    for name in COLUMNS[2:]:
+        columns[name] = [value for table in tables for value in table.column(name)]
+    return columns
+
+
+def aggregate(columns):
+    """Returns per second aggregates of every stream: blocks, bytes, duration, video keyframes
+       and the longest step from the previous block of stream, msec"""
+    if numpy is not None:
+        order = numpy.lexsort((columns['timestamp'], columns['stream_id']))
+        stream_ids = columns['stream_id'][order]
+        timestamps = columns['timestamp'][order].astype(numpy.int64)
+        if not len(order):
+            return {name: numpy.zeros(0, numpy.int64) for name in AGGREGATES}
+        seconds = timestamps // 1000
+        steps = numpy.zeros(len(order), numpy.int64)
+        steps[1:] = numpy.diff(timestamps)
+        steps[1:][stream_ids[1:] != stream_ids[:-1]] = 0
+        starts = numpy.flatnonzero(numpy.concatenate(([True], (stream_ids[1:] != stream_ids[:-1]) |
+                                                      (seconds[1:] != seconds[:-1]))))
+        keyframes = ((columns['stream_type'] == 1) & (columns['block_type'] == 5))[order].astype(numpy.int64)
+        return {'stream_id': stream_ids[starts],
+                'second': seconds[starts],
+                'blocks': numpy.diff(numpy.append(starts, len(order))),
+                'bytes': numpy.add.reduceat(columns['block_size'][order], starts),
+                'duration': numpy.add.reduceat(columns['duration'][order], starts),
+                'keyframes': numpy.add.reduceat(keyframes, starts),
+                'max_gap': numpy.maximum.reduceat(steps, starts)}
+    order = sorted(range(len(columns['timestamp'])),
+                   key=lambda i: (columns['stream_id'][i], columns['timestamp'][i]))
+    result = {name: [] for name in AGGREGATES}
+    previous = None
+    for i in order:
+        stream_id, timestamp = columns['stream_id'][i], columns['timestamp'][i]
+        step = timestamp - previous[1] if previous is not None and previous[0] == stream_id else 0
+        if previous is None or previous[0] != stream_id or timestamp // 1000 != result['second'][-1]:
+            for name, value in zip(AGGREGATES, (stream_id, timestamp // 1000, 0, 0, 0, 0, step)):
+                result[name].append(value)
+        result['blocks'][-1] += 1
+        result['bytes'][-1] += columns['block_size'][i]
+        result['duration'][-1] += columns['duration'][i]
+        result['keyframes'][-1] += int(columns['stream_type'][i] == 1 and columns['block_type'][i] == 5)
+        result['max_gap'][-1] = max(result['max_gap'][-1], step)
+        previous = stream_id, timestamp
+    return result
+
+
+def export_format(path):
+    """Returns (path, format) of export file: format is chosen by path extension falling back to CSV
+       if NumPy or pyarrow it needs is not installed, the best available one is used without extension"""
+    base, extension = os.path.splitext(path)
+    extension = extension.lstrip('.')
+    if extension not in FORMATS:
+        base, extension = path, 'parquet' if pyarrow is not None else 'npz' if numpy is not None else 'csv'
+    if (extension == 'parquet' and pyarrow is None) or (extension in ('npz', 'npy') and numpy is None):
+        extension = 'csv'
+    return base + '.' + extension, extension
+
+
+def save(columns, path, export_type):
+    """Saves columns to file of export type"""
+    if export_type == 'npz':
+        numpy.savez(path, **columns)
+    elif export_type == 'npy':
+        numpy.save(path, numpy.rec.fromarrays(list(columns.values()), names=list(columns)))
+    elif export_type == 'parquet':
+        pyarrow.parquet.write_table(pyarrow.table(columns), path)
+    else:
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(list(columns))
+            writer.writerows(zip(*[column.tolist() if numpy is not None else column
+                                   for column in columns.values()]))
+
+
+def export(channel_path, output='', aggregates=False, override=False):
+    """Exports channel index columns to output (def. <channel_id>.index), with per second aggregates
+       to output.seconds file if aggregates is set. Returns export report.
+       Raises IOError if export file exists and override is not set"""
+    started = time.perf_counter()
+    channel = Channel(channel_path)
+    path, export_type = export_format(output or os.path.basename(channel_path.rstrip('/')) + '.index')
+    paths = [path]
+    if aggregates:
+        paths.append(os.path.splitext(path)[0] + '.seconds.' + export_type)
+    for name in paths:
+        if not override and os.path.exists(name):
+            raise IOError(name)
+    columns = load_columns(channel.chunks)
+    save(columns, paths[0], export_type)
+    if aggregates:
+        save(aggregate(columns), paths[1], export_type)
+    return {'channel': channel_path,
+            'chunks': len(channel.chunks),
+            'records': len(columns['timestamp']),
+            'format': export_type,
+            'files': paths,
+            'seconds': round(time.perf_counter() - started, 6)}
@@ -0,0 +1,163 @@
+"""Follows IStream3 channel being recorded and dumps its stream as it grows"""
+import os
+import json
+import time
+import select
+import ctypes
+import ctypes.util
+from .channel import Block, Index, IndexTable, Data, HANDLES
+from .writer import Writer, open_dump
+
+
+class Watcher:
+    """Waits for channel directory changes with inotify, polls if inotify is unavailable"""
+    _mask = 0x2 | 0x8 | 0x80 | 0x100  # IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, path, interval=1.):
+        self._interval = interval
+        self._fd = -1
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0 and libc.inotify_add_watch(fd, os.fsencode(path), self._mask) >= 0:
+                self._fd = fd
+            elif fd >= 0:
+                os.close(fd)
+        except (OSError, AttributeError):
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def notified(self):
+        """returns True if inotify is used"""
+        return self._fd >= 0
+
+    def wait(self):
+        """Waits for directory change or interval expiration"""
+        if self._fd < 0:
+            time.sleep(self._interval)
+            return
+        readable, _, _ = select.select([self._fd], [], [], self._interval)
+        if readable:
+            try:
+                while os.read(self._fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        """Stops watching"""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class Follower:
+    """Dumps channel stream and keeps dumping blocks appended to index files and new chunks.
+       Last dumped position is checkpointed so restarted follower resumes without rescanning"""
+    def __init__(self, dumper, **kwargs):
+        self._dumper = dumper
+        self._checkpoint = kwargs.get('checkpoint', dumper.filename + '.checkpoint')
+        self._interval = kwargs.get('interval', 1.)
+        self._chunk, self._position = '', 0
+
+    def write(self):
+        """Dumps stream till dump range end or interruption"""
+        state = self._load()
+        if state is not None:
+            os.truncate(self._dumper.filename, state['size'])
+            self._chunk, self._position = state['chunk'], state['position']
+            self._dumper.restore(state['dump'])
+        with open_dump(self._dumper.filename, 'wb' if state is None else 'ab') as file, \
+                Writer(file, **self._dumper.writer_options) as writer, \
+                Watcher(self._dumper.channel.path, self._interval) as watcher:
+            if state is None:
+                self._dumper.write_tag(writer)
+                self._dumper.seek(writer)
+                writer.flush()
+                self._save(file)
+            try:
+                while True:
+                    progressed, finished = self._follow(writer)
+                    if progressed:
+                        writer.flush()
+                        self._save(file)
+                    if finished:
+                        break
+                    if not progressed:
+                        watcher.wait()
+            except KeyboardInterrupt:
+                pass
+        self._dumper.finish()
+
+    def _follow(self, writer):
+        """Dumps blocks appeared since last pass. Returns if anything was consumed and if range end is passed"""
+        channel = self._dumper.channel
+        channel.refresh()
+        chunks = [chunk for chunk in channel.chunks if chunk >= self._chunk]
+        progressed = False
+        for chunk in chunks:
+            if chunk != self._chunk:
+                self._chunk, self._position = chunk, 0
+                if chunk != chunks[-1] and self._skipped(chunk):
+                    continue
+            consumed, finished = self._consume(writer, chunk)
+            progressed = progressed or consumed
+            if finished:
+                return progressed, True
+        return progressed, False
+
+    def _skipped(self, chunk):
+        """Marks whole finished chunk consumed if it ends before dump range"""
+        index = Index(chunk, 0)
+        bounds = index.bounds()
+        if not self._dumper.range[0] or bounds is None or bounds[1] >= self._dumper.range[0]:
+            return False
+        self._position = len(index)
+        return True
+
+    def _consume(self, writer, chunk):
+        """Dumps complete index records appended to chunk whose frames are already in data file"""
+        with HANDLES.handle(chunk) as index_file:
+            index_file.seek(self._position * Block.SIZE, 0)
+            table = IndexTable.from_buffer(index_file.read(), self._position)
+        if not len(table):
+            return False, False
+        begin, end = self._dumper.range
+        with Data(chunk.rstrip(".idx")) as data:
+            offsets = table.values('offset')
+            table = table.head(next((i for i, offset in enumerate(offsets) if offset >= len(data)),
+                                    len(offsets)))
+            ready = len(table)
+            table = table.until(end)
+            writer.source = data
+            for blk, frame in data.frames(table.where(stream_id=self._dumper.stream_id, begin=begin)):
+                self._dumper.on_block(writer, blk, frame)
+            writer.flush()
+            writer.source = None
+        self._position += len(table)
+        return len(table) > 0, len(table) < ready
+
+    def _load(self):
+        """Returns checkpointed state or None if there is no checkpoint of existing dump"""
+        if self._dumper.filename == '-' or not os.path.exists(self._checkpoint) or \
+                not os.path.exists(self._dumper.filename):
+            return None
+        with open(self._checkpoint) as checkpoint:
+            return json.load(checkpoint)
+
+    def _save(self, file):
+        """Checkpoints position of the next index record and dump file size"""
+        if self._dumper.filename == '-':
+            return
+        state = {'chunk': self._chunk, 'position': self._position,
+                 'size': os.fstat(file.fileno()).st_size, 'dump': self._dumper.state()}
+        temporary = self._checkpoint + '.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump(state, checkpoint)
+        os.replace(temporary, self._checkpoint)
@@ -1,18 +1,47 @@
 import getopt
+import json
 import sys
-from .dump import Dump
+from .dump import Dump, Demux, TsDump
 from .stream import make_stream_files
+from .follow import Follower
+from .segment import Segmenter
+from .clips import Clips
+from .verify import verify
+from .export import export
+from .stats import STATS
 
 
 def show_params():
     """Shows command line parameters"""
     print("params:\n\t-c(--channel) path to channel directory (req.)\n\t"
           "-i(--id) stream id (def. 0)\n\t"
-          "-d(--dump) path to dumpfile(def. ./channel_id)\n\t"
+          "-d(--dump) path to dumpfile, - for standard output (def. ./channel_id)\n\t"
           "-r(--range) dumping range (from, to) (def. (begin, end))\n\t"
           "-o(--override) override existing file (def. exit without overriding)\n\t"
           "-v(--verb) be verbose - show index blocks\n\t"
           "-s(--stream) store stream files\n\t"
+          "-j(--jobs) number of chunks extracted in parallel (def. 1)\n\t"
+          "-b(--buffers) number of frame buffers read ahead of writing by reader thread "
+          "(def. 0 - no read ahead)\n\t"
+          "-f(--follow) keep dumping blocks appended to channel being recorded, resume from checkpoint\n\t"
+          "-t(--stats) save json performance report to file, - for standard error\n\t"
+          "-p(--profile) save cProfile statistics to file\n\t"
+          "-m(--memory) add traced memory peak to performance report\n\t"
+          "-S(--segment) split dump into segments of seconds starting with keyframes, "
+          "write m3u8 playlist of them\n\t"
+          "-a(--all) dump all channel streams in one pass to dumpfiles in -d directory (def. .)\n\t"
+          "-x(--ts) mux h264 and aac channel streams into MPEG transport stream dumpfile "
+          "(def. ./channel_id.ts)\n\t"
+          "-V(--verify) check channel index integrity with -j processes, save json report to -d file "
+          "(def. standard output), exit status is 1 if errors are found\n\t"
+          "-l(--clips) dump clips listed in file, one 'from, to, output' per line, in one pass, "
+          "relative outputs in -d directory (def. .)\n\t"
+          "-P(--plan) print json estimate of dump range, blocks, frames, duration and size "
+          "computed from index files only\n\t"
+          "-e(--export) export index records of all channel chunks as columns to -d file "
+          "(def. ./channel_id.index), extension .parquet, .npz, .npy or .csv chooses format\n\t"
+          "-A(--aggregates) also export per second aggregates of every stream to .seconds file\n\t"
+          "-g(--gap) timestamp gap reported by integrity check, msec (def. 5000)\n\t"
           "-h(--help) this help")
     sys.exit()
 
@@ -25,13 +54,17 @@ def get_params(argv):
     dump_range = ()
     is_verbose = False
     override = False
-    store_streams = False
+    options = {'stream': False, 'all': False, 'ts': False, 'segment': 0., 'verify': False, 'plan': False,
+               'clips': '', 'export': False, 'aggregates': False, 'gap': 5000, 'jobs': 1, 'read_ahead': 0,
+               'follow': False, 'stats': '', 'profile': '', 'memory': False}
     opts = ()
     try:
         opts, remainder = getopt.getopt(argv,
-                                        "c:i:d:r:ovsh",
+                                        "c:i:d:r:j:b:t:p:g:S:l:movsafxVPeAh",
                                         ["channel=", "id=", "dump=", "range=",
-                                         "override", "verb", "stream", "help"])
+                                         "jobs=", "buffers=", "stats=", "profile=", "gap=", "segment=", "clips=",
+                                         "memory", "override", "verb", "stream", "all", "ts", "verify", "plan",
+                                         "export", "aggregates", "follow", "help"])
         if len(remainder):
             raise getopt.GetoptError('invalid options: ' + ' '.join(remainder))
     except getopt.GetoptError as opt_error:
@@ -48,20 +81,91 @@ def get_params(argv):
             dump_path = arg
         elif opt in ('-r', '--range'):
             dump_range = tuple(int(k) if len(k) else 0 for k in arg.split(','))
+        elif opt in ('-j', '--jobs'):
+            options['jobs'] = int(arg)
+        elif opt in ('-b', '--buffers'):
+            options['read_ahead'] = int(arg)
         elif opt in ('-o', '--override'):
             override = True
         elif opt in ('-v', '--verb'):
             is_verbose = True
         elif opt in ('-s', '--stream'):
-            store_streams = True
+            options['stream'] = True
+        elif opt in ('-a', '--all'):
+            options['all'] = True
+        elif opt in ('-x', '--ts'):
+            options['ts'] = True
+        elif opt in ('-S', '--segment'):
+            options['segment'] = float(arg)
+        elif opt in ('-V', '--verify'):
+            options['verify'] = True
+        elif opt in ('-l', '--clips'):
+            options['clips'] = arg
+        elif opt in ('-P', '--plan'):
+            options['plan'] = True
+        elif opt in ('-e', '--export'):
+            options['export'] = True
+        elif opt in ('-A', '--aggregates'):
+            options['aggregates'] = True
+        elif opt in ('-g', '--gap'):
+            options['gap'] = int(arg)
+        elif opt in ('-f', '--follow'):
+            options['follow'] = True
+        elif opt in ('-t', '--stats'):
+            options['stats'] = arg
+        elif opt in ('-p', '--profile'):
+            options['profile'] = arg
+        elif opt in ('-m', '--memory'):
+            options['memory'] = True
     if len(channel_path) == 0:
         show_params()
-    return channel_path, stream_id, dump_path, dump_range, override, is_verbose, store_streams
+    return channel_path, stream_id, dump_path, dump_range, override, is_verbose, options
 
 
 def run():
     params = get_params(sys.argv[1:])
-    if params[-1]:
+    options = params[-1]
+    if options['stats'] or options['profile'] or options['memory']:
+        with STATS.session(options['stats'] or '-', options['profile'], options['memory']):
+            execute(params)
+    else:
+        execute(params)
+
+
+def execute(params):
+    """Runs mode chosen by command line parameters"""
+    options = params[-1]
+    if options['stream']:
         make_stream_files(params[0])
+    elif options['plan']:
+        params = params[:4] + (True,) + params[5:]
+        plan = Demux.make(*params).plan() if options['all'] else Dump.make(*params).plan()
+        json.dump(plan, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    elif options['all']:
+        Demux.make(*params).write()
+    elif options['verify']:
+        try:
+            errors = verify(params[0], params[2], options['jobs'], options['gap'])
+        except IOError as io_error:
+            print('invalid path: ', io_error)
+            sys.exit(1)
+        if errors:
+            sys.exit(1)
+    elif options['export']:
+        try:
+            json.dump(export(params[0], params[2], options['aggregates'], params[4]), sys.stdout, indent=2)
+            sys.stdout.write('\n')
+        except IOError as io_error:
+            print('invalid path: ', io_error)
+            sys.exit()
+    elif options['clips']:
+        Clips.make(*params).write()
+    elif options['ts']:
+        TsDump.make(*params).write()
+    elif options['segment']:
+        Segmenter.make(*params).write()
+    elif options['follow']:
+        Follower(Dump.make(*params)).write()
     else:
         Dump.make(*params).write()
@@ -0,0 +1,151 @@
+"""Splits IStream3 channel stream dump into segments of fixed duration in one pass over channel chunks"""
+import os
+import re
+import sys
+import math
+from .dump import Dump, chunk_frames
+from .catalog import open_channel
+from .writer import Writer, open_dump
+
+
+class Segmenter:
+    """Dumps channel stream to numbered segment files and m3u8 playlist of them. A new segment starts
+       with the first block dumper can split at (IDR with its parameter sets for video) after every
+       boundary of segment duration"""
+    @staticmethod
+    def make(*params):
+        """Creates segmenter of stream dump into segments of duration set in options.
+           Playlist and segments are checked before dumper is created, the base dump file is never written"""
+        channel_path, stream_id, dump_path, dump_range, override, verb, *left = params
+        channel_id = channel_path.split('/')[-1]
+        options = left[0] if left else {}
+        try:
+            channel = open_channel(channel_path, stream_id)
+            if len(dump_path) == 0:
+                dump_path = channel_id + '.' + channel.search('encoding')
+            Segmenter.check(*Segmenter.targets(dump_path), override=override)
+            dumper = Dump.create(dump_path, channel,
+                                 channel_id=channel_id,
+                                 stream_id=stream_id,
+                                 range=dump_range,
+                                 verbose=verb,
+                                 jobs=options.get('jobs', 1),
+                                 read_ahead=options.get('read_ahead', 0))
+            if dumper is None:
+                raise IOError('unsupported encoding of stream {}'.format(stream_id))
+            return Segmenter(dumper, options['segment'], override=override)
+        except IOError as io_error:
+            print('invalid path: ', io_error)
+            sys.exit()
+
+    @staticmethod
+    def targets(filename):
+        """Returns segment file name template and playlist path of dump filename"""
+        base, extension = os.path.splitext(filename)
+        return base + '.{:05d}' + extension, base + '.m3u8'
+
+    @staticmethod
+    def check(template, playlist, override=False):
+        """Raises IOError if playlist or any segment file of template exists and override is not set"""
+        if override:
+            return
+        if os.path.exists(playlist):
+            raise IOError(playlist)
+        head, number, tail = os.path.basename(template).partition('{:05d}')
+        pattern = re.compile(re.escape(head) + (r'\d{5}' if number else '') + re.escape(tail) + '$')
+        directory = os.path.dirname(template)
+        if not os.path.isdir(directory or '.'):
+            return
+        for name in sorted(os.listdir(directory or '.')):
+            if pattern.match(name):
+                raise IOError(os.path.join(directory, name))
+
+    def __init__(self, dumper, seconds, **kwargs):
+        self._dumper = dumper
+        self._duration = int(seconds * 1000)
+        template, playlist = Segmenter.targets(dumper.filename)
+        self._template = kwargs.get('template', template)
+        self._playlist = kwargs.get('playlist', playlist)
+        self._override = kwargs.get('override', False)
+        self._segments = []
+        self._file, self._writer = None, None
+        Segmenter.check(self._template, self._playlist, self._override)
+
+    @property
+    def segments(self):
+        """returns (filename, first timestamp, last timestamp) of written segments"""
+        return list(self._segments)
+
+    def write(self):
+        """Dumps stream segments and playlist"""
+        dumper = self._dumper
+        end = dumper.range[1]
+        boundary = None
+        try:
+            self._open(None)
+            dumper.seek(self._writer)
+            for data, frames in chunk_frames(dumper.channel.chunks, (dumper.stream_id,), dumper.range[0], end,
+                                             **dumper.chunk_options):
+                self._writer.source = data
+                for blk, frame in frames:
+                    if boundary is None:
+                        boundary = blk.timestamp + self._duration
+                    elif blk.timestamp >= boundary and dumper.splittable(frame):
+                        self._open(data)
+                        dumper.start_segment(self._writer, frame)
+                        boundary += self._duration * ((blk.timestamp - boundary) // self._duration + 1)
+                    if self._segments[-1][1] is None:
+                        self._segments[-1][1] = blk.timestamp
+                    dumper.on_block(self._writer, blk, frame)
+                    self._segments[-1][2] = blk.timestamp + blk.duration
+                self._writer.flush()
+                self._writer.source = None
+        except IOError:
+            self._close()
+            for segment in self._segments:
+                if os.path.exists(segment[0]):
+                    os.remove(segment[0])
+            self._segments = []
+            raise
+        finally:
+            self._close()
+        if self._segments and self._segments[-1][1] is None:
+            os.remove(self._segments.pop()[0])
+        dumper.finish()
+        self._write_playlist()
+
+    def _open(self, data):
+        """Closes current segment and starts the next one"""
+        self._close()
+        filename = self._template.format(len(self._segments))
+        self._check(filename)
+        self._file = open_dump(filename)
+        self._writer = Writer(self._file, **self._dumper.writer_options)
+        self._writer.source = data
+        self._dumper.write_tag(self._writer)
+        self._segments.append([filename, None, None])
+
+    def _check(self, path):
+        """Raises IOError if file exists and override is not set"""
+        if not self._override and os.path.exists(path):
+            raise IOError(path)
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._file.close()
+            self._file, self._writer = None, None
+
+    def _write_playlist(self):
+        """Writes m3u8 playlist of segments with their durations"""
+        segments = [segment for segment in self._segments if segment[1] is not None]
+        durations = [((following[1] if following is not None else segment[2]) - segment[1]) / 1000.
+                     for segment, following in zip(segments, segments[1:] + [None])]
+        with open(self._playlist, 'w') as playlist:
+            playlist.write('#EXTM3U\n#EXT-X-VERSION:3\n')
+            playlist.write('#EXT-X-TARGETDURATION:{}\n'.format(int(math.ceil(max(durations, default=0)))))
+            playlist.write('#EXT-X-MEDIA-SEQUENCE:0\n')
+            for segment, duration in zip(segments, durations):
+                playlist.write('#EXTINF:{:.3f},\n{}\n'.format(duration, os.path.relpath(
+                    segment[0], os.path.dirname(os.path.abspath(self._playlist)))))
+            playlist.write('#EXT-X-ENDLIST\n')
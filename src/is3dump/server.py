@@ -0,0 +1,204 @@
+"""Serves IStream3 channel clips over HTTP: GET /channel/<id>/stream/<n>?from=..&to=..
+   streams AnnexB or ADTS bytes of stream n in range with chunked transfer encoding"""
+import os
+import sys
+import json
+import getopt
+import asyncio
+import threading
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from .catalog import open_channel
+from .dump import Dump
+
+CONTENT_TYPES = {'h264': 'video/h264', 'aac': 'audio/aac'}
+get_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)  # python 3.6 fallback
+
+
+class ChannelCache:
+    """Channels opened by requests, shared by all of them. Channel is reopened when its directory changes"""
+    def __init__(self, root):
+        self._root = root
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def get(self, channel_id):
+        """Returns channel by id or None if there is no such channel directory"""
+        if not channel_id or channel_id.startswith('.') or '/' in channel_id:
+            return None
+        path = os.path.join(self._root, channel_id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._channels.get(channel_id)
+            if cached is None or cached[0] != mtime:
+                cached = self._channels[channel_id] = (mtime, open_channel(path))
+            return cached[1]
+
+
+class ChunkedSink:
+    """File object of dump thread sending written bytes to HTTP client as transfer encoding chunks.
+       Dump thread waits while client connection is drained"""
+    chunk_size = 1 << 16
+
+    def __init__(self, loop, writer):
+        self._loop = loop
+        self._writer = writer
+        self._buffer = bytearray()
+
+    def write(self, buffer):
+        """Gathers buffer, sends chunk when enough is gathered"""
+        self._buffer += buffer
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+        return len(buffer)
+
+    def flush(self):
+        """Sends gathered bytes as one chunk"""
+        if not self._buffer:
+            return
+        chunk, self._buffer = bytes(self._buffer), bytearray()
+        asyncio.run_coroutine_threadsafe(self._send(chunk), self._loop).result()
+
+    async def _send(self, chunk):
+        self._writer.write(b'%x\r\n' % len(chunk) + chunk + b'\r\n')
+        await self._writer.drain()
+
+
+class ClipServer:
+    """Asyncio HTTP server of channel clips, dumps run in thread pool of workers"""
+    def __init__(self, root, **kwargs):
+        self._channels = ChannelCache(root)
+        self._host = kwargs.get('host', '127.0.0.1')
+        self._port = kwargs.get('port', 8080)
+        self._pool = ThreadPoolExecutor(kwargs.get('workers', 16))
+        self._server = None
+
+    @property
+    def port(self):
+        """returns port server listens on"""
+        if self._server is not None and self._server.sockets:
+            return self._server.sockets[0].getsockname()[1]
+        return self._port
+
+    async def start(self):
+        """Starts listening"""
+        self._server = await asyncio.start_server(self._handle, self._host, self._port)
+        return self
+
+    async def stop(self):
+        """Stops listening and waits for server to close"""
+        self._server.close()
+        await self._server.wait_closed()
+        self._pool.shutdown()
+
+    async def _handle(self, reader, writer):
+        """Serves one request"""
+        try:
+            request = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            if len(request) != 3 or request[0] != 'GET':
+                await self._respond(writer, 405, 'Method Not Allowed')
+                return
+            url = urlsplit(request[1])
+            parts = [part for part in url.path.split('/') if part]
+            channel = self._channels.get(parts[1]) if len(parts) > 1 and parts[0] == 'channel' else None
+            if channel is None:
+                await self._respond(writer, 404, 'Not Found')
+            elif len(parts) == 2:
+                await self._respond(writer, 200, 'OK', 'application/json',
+                                    json.dumps({str(sid): channel.search('encoding', sid)
+                                                for sid in channel.stream_ids}).encode())
+            elif len(parts) == 4 and parts[2] == 'stream' and parts[3].isdigit():
+                await self._clip(writer, parts[1], channel, int(parts[3]), parse_qs(url.query))
+            else:
+                await self._respond(writer, 404, 'Not Found')
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _clip(self, writer, channel_id, channel, stream_id, query):
+        """Streams clip of channel stream in range of query from and to timestamps"""
+        if stream_id not in channel.stream_ids:
+            await self._respond(writer, 404, 'Not Found')
+            return
+        try:
+            dump_range = tuple(int(query[key][0]) if key in query else 0 for key in ('from', 'to'))
+        except ValueError as error:
+            await self._respond(writer, 400, 'Bad Request', body=str(error).encode())
+            return
+        dumper = Dump.create('', channel, channel_id=channel_id, stream_id=stream_id,
+                             range=dump_range if any(dump_range) else (), log=None)
+        if dumper is None:
+            await self._respond(writer, 415, 'Unsupported Media Type')
+            return
+        writer.write(('HTTP/1.1 200 OK\r\nContent-Type: {}\r\nTransfer-Encoding: chunked\r\n'
+                      'Connection: close\r\n\r\n').format(CONTENT_TYPES[channel.search('encoding', stream_id)])
+                     .encode())
+        sink = ChunkedSink(get_running_loop(), writer)
+
+        def dump():
+            dumper.write_to(sink)
+            sink.flush()
+        await get_running_loop().run_in_executor(self._pool, dump)
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    @staticmethod
+    async def _respond(writer, code, reason, content_type='text/plain', body=b''):
+        body = body or reason.encode()
+        writer.write(('HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'
+                      .format(code, reason, content_type, len(body))).encode() + body)
+        await writer.drain()
+
+
+def show_params():
+    """Shows command line parameters"""
+    print("params:\n\t-R(--root) directory with channel directories (req.)\n\t"
+          "-a(--address) address to listen on (def. 127.0.0.1)\n\t"
+          "-p(--port) port to listen on (def. 8080)\n\t"
+          "-n(--workers) number of clips dumped concurrently (def. 16)\n\t"
+          "-h(--help) this help")
+    sys.exit()
+
+
+def run():
+    """Runs clip server by command line parameters"""
+    root, options = '', {}
+    opts = ()
+    try:
+        opts, remainder = getopt.getopt(sys.argv[1:], "R:a:p:n:h",
+                                        ["root=", "address=", "port=", "workers=", "help"])
+        if len(remainder):
+            raise getopt.GetoptError('invalid options: ' + ' '.join(remainder))
+    except getopt.GetoptError as opt_error:
+        print(opt_error)
+        show_params()
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            show_params()
+        elif opt in ('-R', '--root'):
+            root = arg
+        elif opt in ('-a', '--address'):
+            options['host'] = arg
+        elif opt in ('-p', '--port'):
+            options['port'] = int(arg)
+        elif opt in ('-n', '--workers'):
+            options['workers'] = int(arg)
+    if not root:
+        show_params()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = loop.run_until_complete(ClipServer(root, **options).start())
+    print('serving', root, 'on port', server.port)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
+        loop.close()
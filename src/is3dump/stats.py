@@ -0,0 +1,85 @@
+"""Module describes dump performance counters and phase timers"""
+import sys
+import json
+import time
+import threading
+import contextlib
+
+
+class Stats:
+    """Counters and phase timers of dump hot paths. Hot paths check enabled flag
+       so disabled statistics cost one attribute lookup"""
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._phases = {}
+        self._started = time.perf_counter()
+
+    def reset(self):
+        """Clears counters and timers and restarts elapsed time"""
+        with self._lock:
+            self._counters, self._phases = {}, {}
+            self._started = time.perf_counter()
+
+    @staticmethod
+    def clock():
+        """Returns phase start time"""
+        return time.perf_counter()
+
+    def count(self, name, value=1):
+        """Increments counter by value"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def elapsed(self, phase, start):
+        """Adds time passed since start to phase"""
+        spent = time.perf_counter() - start
+        with self._lock:
+            self._phases[phase] = self._phases.get(phase, 0.) + spent
+
+    def report(self):
+        """Returns counters, seconds per phase and throughput"""
+        elapsed = time.perf_counter() - self._started
+        with self._lock:
+            counters, phases = dict(self._counters), dict(self._phases)
+        return {'elapsed': round(elapsed, 6),
+                'counters': counters,
+                'phases': {phase: round(seconds, 6) for phase, seconds in phases.items()},
+                'blocks_per_second': round(counters.get('blocks', 0) / elapsed, 1) if elapsed else 0.,
+                'bytes_per_second': round(counters.get('bytes', 0) / elapsed, 1) if elapsed else 0.}
+
+    @contextlib.contextmanager
+    def session(self, path, profile='', memory=False):
+        """Collects statistics while in context and saves json report to path ('-' is standard error).
+           Optionally profiles with cProfile saving stats to profile file and traces memory peak"""
+        self.reset()
+        self.enabled = True
+        profiler = None
+        if profile:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+        try:
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(profile)
+            report = self.report()
+            if memory:
+                report['memory_peak'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self.enabled = False
+            if path == '-':
+                json.dump(report, sys.stderr)
+                sys.stderr.write('\n')
+            elif path:
+                with open(path, 'w') as report_file:
+                    json.dump(report, report_file, indent=2)
+
+
+STATS = Stats()
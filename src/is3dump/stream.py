@@ -1,6 +1,6 @@
 import base64
 import json
-from .channel import Block, Index, Channel, Data
+from .channel import Block, IndexTable, Channel, Data, HANDLES
 
 
 class AvcStream:
@@ -42,7 +42,6 @@ class AacStream:
         self._config: str = ''
 
     def on_block(self, blk: Block, data: Data) -> None:
-        frame = data.frame(blk)
         self._config = '18856e500'
 
     def __str__(self):
@@ -65,21 +64,49 @@ class AacStream:
         return len(self._config) > 0
 
 
+class Probe:
+    """Resolves channel streams parameters reading index records in batches.
+       Only parameter sets frames are read, probing stops as soon as every stream is resolved"""
+    def __init__(self, channel: Channel, batch: int = 4096):
+        self._channel = channel
+        self._batch = batch
+        self._streams = {1: AvcStream(), 3: AacStream()}
+
+    @property
+    def streams(self):
+        """returns probed streams by stream type"""
+        return self._streams
+
+    def ready(self) -> bool:
+        return all(stream.ready() for stream in self._streams.values())
+
+    def run(self):
+        """probes channel chunks until every stream is resolved"""
+        for chunk in self._channel.chunks:
+            if self.ready():
+                break
+            self._probe(chunk)
+        return self
+
+    def _probe(self, chunk: str) -> None:
+        with HANDLES.handle(chunk) as index_file, Data(chunk.rstrip(".idx")) as data:
+            position = 0
+            while not self.ready():
+                table = IndexTable.from_buffer(index_file.read(self._batch * Block.SIZE), position)
+                stream_types = tuple(key for key, stream in self._streams.items() if not stream.ready())
+                for blk in table.where(stream_types=stream_types, data_size=len(data)):
+                    self._streams[blk.stream_type].on_block(blk, data)
+                    if self.ready():
+                        return
+                if len(table) < self._batch:
+                    return
+                position += len(table)
+
+
 def make_stream_files(channel_path: str):
-    channel: Channel = Channel(channel_path)
-    avc_stream: AvcStream = AvcStream()
-    aac_stream: AacStream = AacStream()
-    for chunk in channel.chunks:
-        data = Data(chunk.rstrip(".idx"))
-        for blk in Index(chunk, 0):
-            if blk.stream_type == 1:
-                avc_stream.on_block(blk, data)
-            elif blk.stream_type == 3:
-                aac_stream.on_block(blk, data)
-            if avc_stream.ready():
-                with open('stream.0.1.json', 'w') as f:
-                    f.write(str(avc_stream))
-            if aac_stream.ready():
-                with open('stream.2.3.json', 'w') as f:
-                    f.write(str(aac_stream))
-        break
+    probe: Probe = Probe(Channel(channel_path)).run()
+    for filename, stream_type in (('stream.0.1.json', 1), ('stream.2.3.json', 3)):
+        stream = probe.streams[stream_type]
+        if stream.ready():
+            with open(filename, 'w') as f:
+                f.write(str(stream))
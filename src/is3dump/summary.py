@@ -0,0 +1,189 @@
+"""Module describes IStream3 index file summary cached between runs"""
+import os
+import json
+import hashlib
+import tempfile
+import contextlib
+import threading
+from collections import OrderedDict
+from .channel import Block, IndexTable
+
+
+class Summary:
+    """IStream3 index file summary: time coverage, per stream statistics
+       and positions of keyframe, SPS and PPS records"""
+    directory = os.environ.get('IS3DUMP_CACHE',
+                               os.path.join(os.path.expanduser('~'), '.cache', 'is3dump'))
+    version = 3
+    memory = OrderedDict()
+    memory_limit = int(os.environ.get('IS3DUMP_MAX_SUMMARIES', 4096))
+    _lock = threading.Lock()
+
+    @staticmethod
+    def load(path):
+        """Returns up to date summary of index file. Cached summary is reused if index file is intact,
+           updated with appended records if index file has grown keeping the last summarized record
+           and rebuilt otherwise.
+           The latest summaries loaded by process are kept in memory"""
+        stat = os.stat(path)
+        summary = Summary._valid(path, stat)
+        if summary is not None:
+            return summary
+        summary = Summary(path)
+        cached = summary._read()
+        if cached and cached.get('version') != Summary.version:
+            cached = None
+        if cached and cached['size'] < stat.st_size and not cached['broken'] and summary._appended(cached):
+            summary._fields = cached
+        summary._update(stat)
+        summary._save()
+        Summary._remember(path, summary._fields)
+        return summary
+
+    @staticmethod
+    def cached(path):
+        """Returns summary of index file if it is already cached in memory or on disk and up to date,
+           None otherwise. Index file records are never read"""
+        try:
+            return Summary._valid(path, os.stat(path))
+        except OSError:
+            return None
+
+    @staticmethod
+    def _valid(path, stat):
+        """Returns cached summary matching index file stat or None"""
+        summary = Summary(path)
+        for read in (Summary.memory.get, lambda _: summary._read()):
+            fields = read(path)
+            if fields and fields.get('version') == Summary.version and \
+                    fields['size'] == stat.st_size and fields['mtime'] == stat.st_mtime_ns:
+                summary._fields = fields
+                Summary._remember(path, fields)
+                return summary
+        return None
+
+    @staticmethod
+    def _remember(path, fields):
+        """Keeps summary fields in memory evicting the least recently used ones above limit"""
+        with Summary._lock:
+            Summary.memory[path] = fields
+            Summary.memory.move_to_end(path)
+            while len(Summary.memory) > Summary.memory_limit:
+                Summary.memory.popitem(last=False)
+
+    def __init__(self, path):
+        self._path = path
+        self._fields = {'version': Summary.version, 'size': 0, 'mtime': 0, 'count': 0, 'broken': False,
+                        'tail': '', 'first': 0, 'last': 0, 'streams': {}, 'keyframes': [], 'sps': [], 'pps': []}
+
+    def __len__(self):
+        return self._fields['count']
+
+    @property
+    def path(self):
+        """returns summarized index file path"""
+        return self._path
+
+    @property
+    def bounds(self):
+        """returns minimal and maximal index file timestamps or None if index is empty"""
+        if not self._fields['count']:
+            return None
+        return self._fields['first'], self._fields['last']
+
+    @property
+    def streams(self):
+        """returns block count and byte total per stream id"""
+        return {int(stream_id): stream for stream_id, stream in self._fields['streams'].items()}
+
+    @property
+    def keyframes(self):
+        """returns (position, timestamp, stream id) of video IDR records"""
+        return self._fields['keyframes']
+
+    @property
+    def sps(self):
+        """returns (position, timestamp, stream id) of video SPS records"""
+        return self._fields['sps']
+
+    @property
+    def pps(self):
+        """returns (position, timestamp, stream id) of video PPS records"""
+        return self._fields['pps']
+
+    def last(self, key, stream_id, timestamp=None, position=None):
+        """returns (position, timestamp) of the last record of keyframes, sps or pps of stream
+           not later than timestamp and preceding position or None if there is no such record"""
+        for record_position, record_timestamp, record_stream in reversed(self._fields[key]):
+            if record_stream == stream_id and (timestamp is None or record_timestamp <= timestamp) and \
+                    (position is None or record_position < position):
+                return record_position, record_timestamp
+        return None
+
+    def _cache_path(self):
+        key = hashlib.sha1(os.path.abspath(self._path).encode()).hexdigest()
+        return os.path.join(self.directory, key + '.json')
+
+    def _read(self):
+        if not self.directory:
+            return None
+        try:
+            with open(self._cache_path()) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self):
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp('.tmp', os.path.basename(self._cache_path()),
+                                                     self.directory)
+        except OSError:
+            return
+        try:
+            with os.fdopen(descriptor, 'w') as cache_file:
+                json.dump(self._fields, cache_file, separators=(',', ':'))
+            os.replace(temporary, self._cache_path())
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(temporary)
+
+    def _appended(self, fields):
+        """Checks if the last summarized record is unchanged, so index file has only been appended to"""
+        if not fields['count']:
+            return True
+        with open(self._path, 'rb') as index_file:
+            index_file.seek((fields['count'] - 1) * Block.SIZE, 0)
+            return index_file.read(Block.SIZE).hex() == fields['tail']
+
+    def _update(self, stat):
+        """Summarizes records appended after already summarized ones"""
+        fields = self._fields
+        with open(self._path, 'rb') as index_file:
+            index_file.seek(fields['count'] * Block.SIZE, 0)
+            buffer = index_file.read()
+        table = IndexTable.from_buffer(buffer, fields['count'])
+        fields['broken'] = len(table) < len(buffer) // Block.SIZE
+        fields['size'], fields['mtime'] = stat.st_size, stat.st_mtime_ns
+        if not len(table):
+            return
+        fields['tail'] = buffer[(len(table) - 1) * Block.SIZE:len(table) * Block.SIZE].hex()
+        timestamps = table.values('timestamp')
+        first, last = min(timestamps), max(timestamps)
+        fields['first'] = min(fields['first'], first) if fields['count'] else first
+        fields['last'] = max(fields['last'], last) if fields['count'] else last
+        fields['count'] += len(table)
+        streams = fields['streams']
+        for stream_id, (blocks, size) in table.streams().items():
+            stream = streams.setdefault(str(stream_id), {'blocks': 0, 'bytes': 0})
+            stream['blocks'] += blocks
+            stream['bytes'] += size
+        video = table.where(stream_types=(1,), block_types=(5, 7, 8))
+        for position, block_type, timestamp, stream_id in zip(video.positions,
+                                                              video.values('block_type'),
+                                                              video.values('timestamp'),
+                                                              video.values('stream_id')):
+            key = 'keyframes' if block_type == 5 else 'sps' if block_type == 7 else 'pps'
+            fields[key].append([position, timestamp, stream_id])
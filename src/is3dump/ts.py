@@ -0,0 +1,217 @@
+"""Module describes MPEG transport stream (ISO/IEC 13818-1) multiplexer of
+   h264 and aac elementary streams: program tables, PES packets and 188-byte
+   transport packets with program clock reference"""
+from enum import IntEnum
+
+PACKET_SIZE = 188
+PAYLOAD_SIZE = PACKET_SIZE - 4
+SYNC_BYTE = 0x47
+PAT_PID = 0x0000
+PMT_PID = 0x1000
+FIRST_PID = 0x0100
+CLOCK_WRAP = 1 << 33
+
+
+class StreamType(IntEnum):
+    """Program map table stream type"""
+    AAC = 0x0f
+    H264 = 0x1b
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04c11db7) if crc & 0x80000000 else crc << 1
+        table.append(crc & 0xffffffff)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc32(data):
+    """Returns MPEG-2 CRC32 of program table section"""
+    crc = 0xffffffff
+    for byte in data:
+        crc = ((crc << 8) & 0xffffffff) ^ _CRC_TABLE[((crc >> 24) ^ byte) & 0xff]
+    return crc
+
+
+def encode_timestamp(prefix, clock):
+    """Returns 5-byte PES timestamp field of 90 kHz clock"""
+    return bytes([(prefix << 4) | (((clock >> 30) & 7) << 1) | 1,
+                  (clock >> 22) & 0xff,
+                  (((clock >> 15) & 0x7f) << 1) | 1,
+                  (clock >> 7) & 0xff,
+                  ((clock & 0x7f) << 1) | 1])
+
+
+def encode_pcr(clock):
+    """Returns 6-byte program clock reference of 90 kHz clock with zero extension"""
+    return bytes([(clock >> 25) & 0xff,
+                  (clock >> 17) & 0xff,
+                  (clock >> 9) & 0xff,
+                  (clock >> 1) & 0xff,
+                  ((clock & 1) << 7) | 0x7e,
+                  0x00])
+
+
+class Packetizer:
+    """Splits program tables and PES packets of one program into transport packets
+       keeping continuity counter of every PID"""
+    def __init__(self, stream_types, pcr_pid=None):
+        self._streams = [(FIRST_PID + number, stream_type) for number, stream_type in enumerate(stream_types)]
+        self._types = dict(self._streams)
+        self._pcr_pid = pcr_pid if pcr_pid is not None else self._streams[0][0]
+        self._counters = {}
+
+    @property
+    def pids(self):
+        """returns elementary streams PIDs"""
+        return [pid for pid, _ in self._streams]
+
+    @property
+    def pcr_pid(self):
+        """returns PID carrying program clock reference"""
+        return self._pcr_pid
+
+    def tables(self):
+        """Returns program association and program map tables packets"""
+        pat = bytes([0x00, 0x01, 0xc1, 0x00, 0x00, 0x00, 0x01, 0xe0 | (PMT_PID >> 8), PMT_PID & 0xff])
+        pmt = bytearray([0x00, 0x01, 0xc1, 0x00, 0x00, 0xe0 | (self._pcr_pid >> 8), self._pcr_pid & 0xff,
+                         0xf0, 0x00])
+        for pid, stream_type in self._streams:
+            pmt.extend([stream_type, 0xe0 | (pid >> 8), pid & 0xff, 0xf0, 0x00])
+        return self._section(PAT_PID, 0x00, pat) + self._section(PMT_PID, 0x02, pmt)
+
+    def pes(self, pid, payload, pts, dts=None, keyframe=False, pcr=None):
+        """Returns transport packets of PES packet with payload presented at pts (decoded at dts)"""
+        video = self._types[pid] == StreamType.H264
+        if dts is None or dts == pts:
+            fields = encode_timestamp(0x2, pts)
+        else:
+            fields = encode_timestamp(0x3, pts) + encode_timestamp(0x1, dts)
+        length = 3 + len(fields) + len(payload)
+        header = bytes([0x00, 0x00, 0x01, 0xe0 if video else 0xc0,
+                        (length >> 8) & 0xff if length < 0x10000 else 0,
+                        length & 0xff if length < 0x10000 else 0,
+                        0x80, 0x80 if len(fields) == 5 else 0xc0, len(fields)]) + fields
+        adaptation = None
+        if keyframe or pcr is not None:
+            adaptation = bytes([(0x40 if keyframe else 0x00) | (0x10 if pcr is not None else 0x00)])
+            if pcr is not None:
+                adaptation += encode_pcr(pcr)
+        return self._packets(pid, header + payload, adaptation)
+
+    def _section(self, pid, table_id, body):
+        """Returns transport packet of program table section"""
+        section = bytes([table_id, 0xb0 | ((len(body) + 4) >> 8), (len(body) + 4) & 0xff]) + body
+        section += crc32(section).to_bytes(4, byteorder='big')
+        return self._header(pid, True, 1) + b'\x00' + section + b'\xff' * (PAYLOAD_SIZE - 1 - len(section))
+
+    def _header(self, pid, start, control):
+        counter = self._counters.get(pid, 0)
+        self._counters[pid] = (counter + 1) & 0x0f
+        return bytes([SYNC_BYTE, (0x40 if start else 0x00) | (pid >> 8), pid & 0xff, (control << 4) | counter])
+
+    def _packets(self, pid, payload, adaptation=None):
+        """Returns payload split into transport packets, the first one starts unit and has adaptation fields"""
+        packets = bytearray()
+        position = 0
+        while position < len(payload) or not packets:
+            room = PAYLOAD_SIZE - (len(adaptation) + 1 if adaptation is not None else 0)
+            piece = payload[position:position + room]
+            stuffing = room - len(piece)
+            if adaptation is not None:
+                field = bytes([len(adaptation) + stuffing]) + adaptation + b'\xff' * stuffing
+            elif stuffing == 1:
+                field = b'\x00'
+            elif stuffing:
+                field = bytes([stuffing - 1, 0x00]) + b'\xff' * (stuffing - 2)
+            else:
+                field = b''
+            packets += self._header(pid, position == 0, 3 if field else 1)
+            packets += field
+            packets += piece
+            position += len(piece)
+            adaptation = None
+        return packets
+
+
+class Muxer:
+    """Transport stream multiplexer writing PES packets of elementary streams to writer.
+       Millisecond block timestamps are rebased to the first written block and converted to 90 kHz clock"""
+    delay = 63000  # decoding time lead over program clock, 0.7 s
+
+    def __init__(self, writer, stream_types):
+        self._writer = writer
+        self._stream_types = list(stream_types)
+        video = [number for number, stream_type in enumerate(stream_types) if stream_type == StreamType.H264]
+        self._packetizer = Packetizer(stream_types, FIRST_PID + (video[0] if video else 0))
+        self._origin = None
+        self._tables_written = False
+        self.packets = 0
+
+    def stream(self, number):
+        """Returns collector of elementary stream frames of stream number (in muxer stream types)"""
+        return Stream(self, self._packetizer.pids[number], self._stream_types[number] == StreamType.H264)
+
+    def start(self, timestamp):
+        """Sets clock origin to timestamp of the first written block"""
+        if self._origin is None:
+            self._origin = timestamp
+
+    def clock(self, timestamp):
+        """Returns 90 kHz clock of millisecond timestamp"""
+        return ((timestamp - self._origin) * 90 + self.delay) % CLOCK_WRAP
+
+    def write(self, pid, payload, block, keyframe=False):
+        """Writes PES packet of access unit timed by its first block. Block timestamp is presentation time,
+           decoding time is earlier by composition offset of relative timestamps"""
+        if not self._tables_written or keyframe:
+            self._writer.write(self._packetizer.tables())
+            self._tables_written = True
+        pts = self.clock(block.timestamp)
+        dts = (pts - max(0, block.ts_rel - block.dts_rel) * 90) % CLOCK_WRAP
+        pcr = max(0, dts - self.delay) if pid == self._packetizer.pcr_pid else None
+        packets = self._packetizer.pes(pid, payload, pts, dts, keyframe, pcr)
+        self.packets += len(packets) // PACKET_SIZE
+        self._writer.write(packets)
+
+
+class Stream:
+    """Elementary stream collector used as stream dumper file. Frames are gathered into access units:
+       video frames of the same timestamp with preceding parameter sets, audio frames up to audio_size bytes"""
+    audio_size = 2048
+
+    def __init__(self, muxer, pid, video):
+        self._muxer = muxer
+        self._pid = pid
+        self._video = video
+        self._pending = bytearray()
+        self._block = None
+        self._keyframe = False
+
+    def write_frame(self, header, frame, block):
+        """Adds frame with its header to access unit, writes previous unit when frame starts new one"""
+        timed = not self._video or (frame[0] & 0x1f) <= 5
+        if self._block is not None and \
+                (block.timestamp != self._block.timestamp if self._video
+                 else len(self._pending) + len(header) + len(frame) > self.audio_size):
+            self.flush()
+        if timed and self._block is None:
+            self._block = block
+            self._muxer.start(block.timestamp)
+        self._keyframe = self._keyframe or (self._video and (frame[0] & 0x1f) == 5)
+        self._pending += header
+        self._pending += frame
+
+    def flush(self):
+        """Writes pending access unit"""
+        if self._block is not None:
+            self._muxer.write(self._pid, bytes(self._pending), self._block, self._keyframe)
+        self._pending = bytearray()
+        self._block = None
+        self._keyframe = False
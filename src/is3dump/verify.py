@@ -0,0 +1,133 @@
+"""Verifies IStream3 channel archive integrity reading index files only: broken marks,
+   truncated records, frames outside data files, timestamps going backward and gaps per stream"""
+import os
+import sys
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .channel import Block, Channel, INDEX_DTYPE, numpy
+
+GAPS_LIMIT = 100
+
+
+def decode(buffer):
+    """Returns columns of all index records in buffer including ones with broken marks"""
+    count = len(buffer) // Block.SIZE
+    if numpy is not None:
+        records = numpy.frombuffer(buffer, dtype=INDEX_DTYPE, count=count)
+        return {name: records[name] for name in INDEX_DTYPE.names}
+    records = list(Block.STRUCT.iter_unpack(memoryview(buffer)[:count * Block.SIZE]))
+    return {name: [record[number] for record in records] for number, name in enumerate(Block.FIELDS)}
+
+
+def check_stream(timestamps, gap):
+    """Returns report of timestamps of one stream: bounds, backward steps and gaps longer than gap"""
+    if numpy is not None:
+        steps = numpy.diff(timestamps.astype(numpy.int64))
+        backward = int((steps < 0).sum())
+        gaps = [int(position) for position in numpy.flatnonzero(steps > gap)]
+    else:
+        steps = [current - previous for previous, current in zip(timestamps, timestamps[1:])]
+        backward = sum(1 for step in steps if step < 0)
+        gaps = [position for position, step in enumerate(steps) if step > gap]
+    return {'records': len(timestamps),
+            'first': int(timestamps[0]),
+            'last': int(timestamps[-1]),
+            'non_monotonic': backward,
+            'gaps': len(gaps),
+            'gap_ranges': [[int(timestamps[position]), int(timestamps[position + 1])]
+                           for position in gaps[:GAPS_LIMIT]]}
+
+
+def verify_chunk(chunk, gap=5000):
+    """Returns integrity report of chunk index file checked against its data file size"""
+    with open(chunk, 'rb') as index_file:
+        buffer = index_file.read()
+    data_path = chunk.rstrip(".idx")
+    data_size = os.path.getsize(data_path) if os.path.exists(data_path) else None
+    columns = decode(buffer)
+    report = {'chunk': chunk,
+              'bytes': len(buffer),
+              'records': len(buffer) // Block.SIZE,
+              'truncated_bytes': len(buffer) % Block.SIZE,
+              'missing_data': data_size is None}
+    if numpy is not None:
+        good = columns['mark'] == Block.MARK
+        broken = numpy.flatnonzero(~good)
+        columns = {name: column[good] for name, column in columns.items()}
+        report['bad_marks'] = int(broken.size)
+        report['first_bad_mark'] = int(broken[0]) if broken.size else None
+        report['bad_entry_sizes'] = int((columns['entry_size'] != Block.SIZE).sum())
+        report['bad_sizes'] = int((columns['block_size'] > columns['offset']).sum())
+        report['out_of_bounds'] = int((columns['offset'] > data_size).sum()) if data_size is not None else 0
+        streams = {int(stream_id): columns['timestamp'][columns['stream_id'] == stream_id]
+                   for stream_id in numpy.unique(columns['stream_id'])}
+    else:
+        good = [mark == Block.MARK for mark in columns['mark']]
+        broken = [position for position, ok in enumerate(good) if not ok]
+        columns = {name: [value for value, ok in zip(column, good) if ok] for name, column in columns.items()}
+        report['bad_marks'] = len(broken)
+        report['first_bad_mark'] = broken[0] if broken else None
+        report['bad_entry_sizes'] = sum(1 for size in columns['entry_size'] if size != Block.SIZE)
+        report['bad_sizes'] = sum(1 for size, offset in zip(columns['block_size'], columns['offset'])
+                                  if size > offset)
+        report['out_of_bounds'] = sum(1 for offset in columns['offset'] if offset > data_size) \
+            if data_size is not None else 0
+        streams = {}
+        for stream_id, timestamp in zip(columns['stream_id'], columns['timestamp']):
+            streams.setdefault(stream_id, []).append(timestamp)
+    report['streams'] = {str(stream_id): check_stream(timestamps, gap)
+                         for stream_id, timestamps in sorted(streams.items())}
+    report['errors'] = (int(report['truncated_bytes'] > 0) + int(report['missing_data']) + report['bad_marks'] +
+                        report['bad_entry_sizes'] + report['bad_sizes'] + report['out_of_bounds'] +
+                        sum(stream['non_monotonic'] for stream in report['streams'].values()))
+    return report
+
+
+def verify_channel(channel_path, jobs=1, gap=5000):
+    """Returns integrity report of all channel chunks scanned by jobs processes.
+       Only chunks with errors or gaps are listed, streams are also checked across chunk boundaries"""
+    started = time.perf_counter()
+    chunks = Channel(channel_path).chunks
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as pool:
+            reports = list(pool.map(verify_chunk, chunks, [gap] * len(chunks),
+                                    chunksize=max(1, len(chunks) // (jobs * 8))))
+    else:
+        reports = [verify_chunk(chunk, gap) for chunk in chunks]
+    boundaries, last = [], {}
+    for report in reports:
+        for stream_id, stream in report['streams'].items():
+            if stream_id in last:
+                step = stream['first'] - last[stream_id]
+                if step < 0 or step > gap:
+                    boundaries.append({'chunk': report['chunk'], 'stream': int(stream_id),
+                                       'from': last[stream_id], 'to': stream['first'],
+                                       'problem': 'non_monotonic' if step < 0 else 'gap'})
+            last[stream_id] = stream['last']
+    errors = sum(report['errors'] for report in reports) + \
+        sum(1 for boundary in boundaries if boundary['problem'] == 'non_monotonic')
+    return {'channel': channel_path,
+            'chunks': len(reports),
+            'records': sum(report['records'] for report in reports),
+            'bytes': sum(report['bytes'] for report in reports),
+            'errors': errors,
+            'gaps': sum(stream['gaps'] for report in reports for stream in report['streams'].values()) +
+            sum(1 for boundary in boundaries if boundary['problem'] == 'gap'),
+            'seconds': round(time.perf_counter() - started, 6),
+            'problems': [report for report in reports
+                         if report['errors'] or any(stream['gaps'] for stream in report['streams'].values())],
+            'boundaries': boundaries}
+
+
+def verify(channel_path, report_path='', jobs=1, gap=5000):
+    """Verifies channel saving json report to report_path (standard output if empty or -).
+       Returns number of errors found"""
+    report = verify_channel(channel_path, jobs, gap)
+    if report_path and report_path != '-':
+        with open(report_path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    return report['errors']
@@ -0,0 +1,173 @@
+"""Module describes dump file writer gathering frames into large writes"""
+import io
+import os
+import sys
+import time
+import threading
+from .stats import STATS
+
+
+def open_dump(filename, mode='wb'):
+    """Opens dump file, '-' stands for standard output"""
+    if filename == '-':
+        sys.stdout.flush()
+        return open(sys.stdout.fileno(), 'wb', closefd=False)
+    return open(filename, mode)
+
+
+class Throttle:
+    """Token bucket capping bandwidth of writers it is shared by"""
+    def __init__(self, rate):
+        self._rate = rate
+        self._available = rate
+        self._time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, count):
+        """Waits until count bytes may be written"""
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(self._rate, self._available + (now - self._time) * self._rate) - count
+            self._time = now
+            delay = -self._available / self._rate if self._available < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+class Writer:
+    """Dump file writer. Buffers are gathered and flushed with one vectored write,
+       large unchanged frames are copied from data file to dump file in kernel"""
+    flush_size = 1 << 20
+    copy_threshold = 1 << 18
+    _iov_max = 1024
+
+    def __init__(self, file, **kwargs):
+        self._file = file
+        self._flush_size = kwargs.get('flush_size', Writer.flush_size)
+        self._copy_threshold = kwargs.get('copy_threshold', Writer.copy_threshold)
+        self._throttle = kwargs.get('throttle')
+        self._buffers = []
+        self._pending = 0
+        self._source = None
+        self._copy_file_range = hasattr(os, 'copy_file_range')
+        self._sendfile = hasattr(os, 'sendfile')
+        self.written = 0
+        file.flush()
+        try:
+            self._fd = file.fileno() if hasattr(os, 'writev') else None
+        except (AttributeError, io.UnsupportedOperation):
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def file(self):
+        """returns dump file written to"""
+        return self._file
+
+    def source(self, data):
+        """Sets data file frames are taken from"""
+        self._source = data
+
+    source = property(None, source)
+
+    def write(self, *buffers):
+        """Queues buffers to be written, flushes them if enough is gathered"""
+        for buffer in buffers:
+            self._buffers.append(buffer)
+            self._pending += len(buffer)
+        if self._pending >= self._flush_size:
+            self.flush()
+
+    def write_frame(self, header, frame, block):
+        """Writes frame with its header. Large frames are copied from source data file in kernel"""
+        if self._copy_threshold and len(frame) >= self._copy_threshold and \
+                self._fd is not None and self._source is not None:
+            self.write(header)
+            self.flush()
+            if self._copy(self._source.fileno(), block.offset-len(block), len(frame)):
+                return
+            header = b''
+        self.write(header, frame)
+
+    def flush(self):
+        """Writes all gathered buffers"""
+        if not self._buffers:
+            return
+        if self._throttle is not None:
+            self._throttle.take(self._pending)
+        clock = STATS.clock() if STATS.enabled else 0
+        buffers, pending = self._buffers, self._pending
+        self.written += pending
+        self._buffers, self._pending = [], 0
+        if self._fd is None:
+            for buffer in buffers:
+                self._file.write(buffer)
+            calls = len(buffers)
+        else:
+            calls = self._writev(buffers)
+        if STATS.enabled:
+            STATS.elapsed('write', clock)
+            STATS.count('write_calls', calls)
+            STATS.count('written_bytes', pending)
+
+    def _writev(self, buffers):
+        """Writes buffers with vectored writes resuming partial ones. Returns number of calls"""
+        calls = 0
+        while buffers:
+            batch = buffers[:self._iov_max]
+            written = os.writev(self._fd, batch)
+            calls += 1
+            done = 0
+            for buffer in batch:
+                if written < len(buffer):
+                    break
+                written -= len(buffer)
+                done += 1
+            buffers = buffers[done:]
+            if written:
+                buffers[0] = memoryview(buffers[0])[written:]
+        return calls
+
+    def close(self):
+        """Flushes gathered buffers"""
+        self.flush()
+        self._source = None
+
+    def _copy(self, source, offset, count):
+        """Copies count bytes from source descriptor at offset to dump file.
+           Returns False if nothing could be copied in kernel"""
+        if self._throttle is not None:
+            self._throttle.take(count)
+        clock = STATS.clock() if STATS.enabled else 0
+        copied = 0
+        while copied < count:
+            done = self._copy_range(source, offset + copied, count - copied)
+            if not done:
+                break
+            copied += done
+        if copied and copied < count:
+            self.write(os.pread(source, count - copied, offset + copied))
+        self.written += copied
+        if STATS.enabled:
+            STATS.elapsed('copy', clock)
+            STATS.count('copied_bytes', copied)
+        return copied > 0
+
+    def _copy_range(self, source, offset, count):
+        """Copies bytes with copy_file_range or sendfile, disables them if unsupported"""
+        if self._copy_file_range:
+            try:
+                return os.copy_file_range(source, self._fd, count, offset)
+            except OSError:
+                self._copy_file_range = False
+        if self._sendfile:
+            try:
+                return os.sendfile(self._fd, source, offset, count)
+            except OSError:
+                self._sendfile = False
+        return 0